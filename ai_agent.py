@@ -1,76 +1,242 @@
 import os
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
-from sqlmodel import select
-from database import SessionDep
-from models import Item, Sale
-from datetime import date, datetime
+from inventory import InventorySnapshot
+from response_cache import ResponseCache
+from metrics import llm_request_duration, llm_time_to_first_token, llm_tokens, register_cache
+from typing import AsyncIterator, Optional
+import asyncio
 import logging
+import random
+import time
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-client = OpenAI(
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+# Seconds allowed for a single completion request.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "10"))
+# Seconds a customer waits in total (queueing and retries included) before
+# getting the inventory-based fallback answer instead.
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "15"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+# One pooled HTTP client for every model call; retries are handled below so
+# the SDK's own retry loop is disabled.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY),
+    timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+)
+client = AsyncOpenAI(
     api_key=os.getenv("GOOGLE_API_KEY"),
-    base_url="https://generativelanguage.googleapis.com/v1beta/"
+    base_url="https://generativelanguage.googleapis.com/v1beta/",
+    http_client=http_client,
+    max_retries=0,
 )
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+    db_path=os.getenv("RESPONSE_CACHE_DB") or None,
+)
+register_cache("response", response_cache.stats)
+
+CUSTOMER_QUERY_PROMPT = "You are an AI assistant for a retail store. Respond to the customer's query based ONLY on the store's current inventory, which is provided below. Do not assume or invent items that are not in the inventory. If the query mentions an item not in stock, politely inform the customer that it is not available. Provide details like quantity and price for items in stock. Keep responses concise and professional."
+
+def build_customer_query_prompt(query: str, inventory: Optional[InventorySnapshot]) -> str:
+    context = inventory.context_for(query) if inventory else "Inventory information is unavailable."
+    return f"{CUSTOMER_QUERY_PROMPT}\n\nCurrent inventory:\n{context}"
+
+async def close_client():
+    await client.close()
+
+def _record_usage(usage) -> None:
+    if usage is None:
+        return
+    llm_tokens.inc(usage.prompt_tokens or 0, type="prompt")
+    llm_tokens.inc(usage.completion_tokens or 0, type="completion")
+
+async def chat_completion(messages: list[dict]) -> str:
+    """Run one chat completion with bounded concurrency and jittered retries."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with llm_semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=messages,
+                        timeout=LLM_TIMEOUT,
+                    )
+                except Exception as e:
+                    llm_request_duration.observe(time.perf_counter() - started, call="completion", outcome=type(e).__name__)
+                    raise
+                llm_request_duration.observe(time.perf_counter() - started, call="completion", outcome="ok")
+            _record_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            # Full jitter keeps retries from a burst of failures spread out.
+            delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** attempt)
+            logger.warning("LLM call failed (%s), retrying in %.2fs", type(e).__name__, delay)
+            await asyncio.sleep(delay)
+
+async def stream_chat_completion(messages: list[dict]) -> AsyncIterator[str]:
+    """Stream completion text as it is generated.
+
+    Connection failures are retried like chat_completion as long as nothing
+    has been yielded yet; once tokens have gone out an error is raised as is.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        started = False
+        try:
+            async with llm_semaphore:
+                requested = time.perf_counter()
+                outcome = "ok"
+                try:
+                    stream = await client.chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=messages,
+                        timeout=LLM_TIMEOUT,
+                        stream=True,
+                    )
+                    async for chunk in stream:
+                        # Usage, when the API reports it, arrives on a final
+                        # chunk without choices.
+                        _record_usage(getattr(chunk, "usage", None))
+                        if not chunk.choices:
+                            continue
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            if not started:
+                                llm_time_to_first_token.observe(time.perf_counter() - requested)
+                            started = True
+                            yield token
+                except BaseException as e:
+                    outcome = type(e).__name__
+                    raise
+                finally:
+                    llm_request_duration.observe(time.perf_counter() - requested, call="stream", outcome=outcome)
+            return
+        except RETRYABLE_ERRORS as e:
+            if started or attempt == LLM_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** attempt)
+            logger.warning("LLM stream failed (%s), retrying in %.2fs", type(e).__name__, delay)
+            await asyncio.sleep(delay)
 
-async def process_customer_query(query: str) -> str:
+def fallback_answer(query: str, inventory: Optional[InventorySnapshot]) -> str:
+    """Deterministic answer built from inventory data when the model is unavailable."""
+    if inventory is None:
+        return "Sorry, I couldn't process your query. Please try again."
+    matches = inventory.matching_items(query)
+    if not matches:
+        return "Sorry, I couldn't find that item in our inventory. Please ask about another product or try again later."
+    lines = []
+    for row in matches:
+        if row.quantity > 0:
+            lines.append(f"{row.name}: {row.quantity} units in stock at ${row.price:.2f} each.")
+        else:
+            lines.append(f"{row.name}: currently out of stock.")
+    return "\n".join(lines)
+
+async def _ask_model(query: str, inventory: Optional[InventorySnapshot]) -> str:
+    return await chat_completion([
+        {"role": "system", "content": build_customer_query_prompt(query, inventory)},
+        {"role": "user", "content": query}
+    ])
+
+async def process_customer_query(query: str, inventory: Optional[InventorySnapshot] = None) -> str:
     try:
-        response = client.chat.completions.create(
-            model="gemini-1.5-flash",
-            messages=[
-                {"role": "system", "content": "You are an AI assistant for a retail store. Respond to the customer's query based ONLY on the store's current inventory, which is provided below. Do not assume or invent items that are not in the inventory. If the query mentions an item not in stock, politely inform the customer that it is not available. Provide details like quantity and price for items in stock. Keep responses concise and professional."},
-                {"role": "user", "content": query}
-            ]
+        if inventory is None:
+            return await asyncio.wait_for(_ask_model(query, None), LLM_DEADLINE)
+        # Answers depend only on the normalized query and the inventory state,
+        # so identical questions between inventory changes share one model call.
+        key = response_cache.make_key(query, inventory.version)
+        return await asyncio.wait_for(
+            response_cache.get_or_compute(key, lambda: _ask_model(query, inventory)),
+            LLM_DEADLINE,
         )
-        return response.choices[0].message.content
     except Exception as e:
-        logger.error(f"Query processing failed: {str(e)}")
-        return "Sorry, I couldn't process your query. Please try again."
+        logger.error("Query processing failed: %s: %s", type(e).__name__, e)
+        return fallback_answer(query, inventory)
+
+async def stream_customer_query(query: str, inventory: Optional[InventorySnapshot] = None) -> AsyncIterator[str]:
+    """Streaming variant of process_customer_query.
 
-async def generate_daily_report(session: SessionDep) -> str:
+    A cached answer is sent as one chunk. Otherwise tokens are yielded as the
+    model produces them and the complete answer is cached afterwards. If no
+    token arrives within LLM_DEADLINE the fallback answer is sent instead;
+    a stream that breaks part-way simply ends.
+    """
+    key = response_cache.make_key(query, inventory.version) if inventory is not None else None
+    if key is not None:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    messages = [
+        {"role": "system", "content": build_customer_query_prompt(query, inventory)},
+        {"role": "user", "content": query}
+    ]
+    # The model stream is consumed by its own task, so the first-token
+    # deadline only cancels a queue read, never the HTTP stream itself.
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for token in stream_chat_completion(messages):
+                queue.put_nowait(token)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    producer = asyncio.create_task(produce())
+    parts = []
     try:
-        today = date.today()
-        logger.debug(f"Generating report for {today}")
-        sales = session.exec(select(Sale).where(Sale.sale_date == today)).all()
-        items = session.exec(select(Item)).all()
-        
-        low_stock = [item for item in items if item.quantity < 10]
-        
-        report = f"Daily Sales Report for {today}\n\n"
-        report += "Sales:\n"
-        total_sales = 0
-        for sale in sales:
-            item = session.get(Item, sale.item_id)
-            if item:
-                report += f"- {item.name}: {sale.quantity} units, Total: ${sale.total:.2f}\n"
-                total_sales += sale.total
+        while True:
+            if parts:
+                item = await queue.get()
             else:
-                logger.warning(f"Item {sale.item_id} not found for sale")
-        report += f"\nTotal Sales: ${total_sales:.2f}\n"
-        
-        report += "\nLow Stock Items:\n"
-        if low_stock:
-            for item in low_stock:
-                report += f"- {item.name}: {item.quantity} units\n"
-        else:
-            report += "No low stock items.\n"
-        
-        logger.debug(f"Raw report: {report}")
-        prompt = f"Generate a concise summary of this store report:\n{report}"
-        response = client.chat.completions.create(
-            model="gemini-1.5-flash",
-            messages=[
-                {"role": "system", "content": "You are a store manager summarizing daily reports."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        summary = response.choices[0].message.content
-        logger.debug(f"Generated summary: {summary}")
-        return summary
+                try:
+                    item = await asyncio.wait_for(queue.get(), LLM_DEADLINE)
+                except asyncio.TimeoutError as e:
+                    item = e
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                if parts:
+                    logger.error("Query stream interrupted after %s chunks: %s: %s", len(parts), type(item).__name__, item)
+                else:
+                    logger.error("Query stream failed: %s: %s", type(item).__name__, item)
+                    yield fallback_answer(query, inventory)
+                return
+            parts.append(item)
+            yield item
+    finally:
+        producer.cancel()
+    if key is not None and parts:
+        await response_cache.put(key, "".join(parts))
+
+async def summarize_report(report: str) -> str:
+    """Summarize a raw daily report; falls back to the raw text when the model is down."""
+    prompt = f"Generate a concise summary of this store report:\n{report}"
+    try:
+        summary = await chat_completion([
+            {"role": "system", "content": "You are a store manager summarizing daily reports."},
+            {"role": "user", "content": prompt}
+        ])
     except Exception as e:
-        logger.error(f"Report generation failed: {str(e)}")
-        raise
\ No newline at end of file
+        # The raw report is still worth sending when the model is down.
+        logger.warning("Report summary failed, sending raw report: %s", e)
+        return report
+    logger.debug("Generated summary: %s", summary)
+    return summary
@@ -0,0 +1,329 @@
+"""Load benchmark for the store API.
+
+Seeds a database with a synthetic catalog and sales history, runs the app
+in-process with the LLM, Twilio and SMTP replaced by fixed-latency stand-ins,
+and drives each scenario at the given concurrency. Throughput and latency
+percentiles are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --items 100000 --sales 500000 --concurrency 32 --output before.json
+    python benchmark.py --items 100000 --sales 500000 --concurrency 32 --output after.json --compare before.json
+
+The benchmark uses its own database file (bench.db by default) and reuses
+it between runs with the same seed parameters; pass --reseed to rebuild it.
+"""
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+
+SCENARIOS = ("items", "sales", "queries", "bot", "daily-report")
+SEED_CHUNK = 10_000
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StubLLM:
+    """Stands in for AsyncOpenAI: answers after a fixed delay, streaming or not."""
+
+    def __init__(self, latency: float, tokens: int = 20):
+        self.latency = latency
+        self.tokens = tokens
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, stream: bool = False, **kwargs):
+        words = [f"word{n} " for n in range(self.tokens)]
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in messages) // 4, completion_tokens=self.tokens)
+        if stream:
+            return self._stream(words, usage)
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="".join(words))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    async def _stream(self, words: list[str], usage):
+        for word in words:
+            await asyncio.sleep(self.latency / len(words))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    async def close(self):
+        pass
+
+class StubWhatsApp:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, body: str, to_numbers: list[str]) -> list[str]:
+        await asyncio.sleep(self.latency)
+        self.sent += len(to_numbers)
+        return [f"SM{self.sent}-{n}" for n in range(len(to_numbers))]
+
+class StubSMTP:
+    sender = "bench@example.com"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, messages) -> None:
+        await asyncio.sleep(self.latency)
+        self.sent += len(messages)
+
+    async def close(self) -> None:
+        pass
+
+def seed_database(path: str, items: int, sales: int, days: int, seed: int) -> dict:
+    """Create `path` with `items` items and `sales` sales spread over `days` days."""
+    from sqlmodel import Session
+    from database import create_db_and_tables, engine
+    from rollup import rebuild_daily_summary
+    from inventory import bump_inventory_version
+
+    rng = random.Random(seed)
+    create_db_and_tables()
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA synchronous=OFF")
+        for start in range(0, items, SEED_CHUNK):
+            connection.executemany(
+                "INSERT INTO item (name, quantity, price, low_stock_threshold) VALUES (?, ?, ?, ?)",
+                [
+                    (f"item-{n:07d}", rng.randint(0, 1_000_000), round(rng.uniform(0.5, 500), 2), 10)
+                    for n in range(start + 1, min(items, start + SEED_CHUNK) + 1)
+                ],
+            )
+        prices = dict(connection.execute("SELECT id, price FROM item"))
+        item_ids = list(prices)
+        first_day = date.today() - timedelta(days=days - 1)
+        for start in range(0, sales, SEED_CHUNK):
+            rows = []
+            for _ in range(start, min(sales, start + SEED_CHUNK)):
+                item_id = rng.choice(item_ids)
+                quantity = rng.randint(1, 5)
+                rows.append((item_id, quantity, round(prices[item_id] * quantity, 2), (first_day + timedelta(days=rng.randrange(days))).isoformat()))
+            connection.executemany("INSERT INTO sale (item_id, quantity, total, sale_date) VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+    finally:
+        connection.close()
+    with Session(engine) as session:
+        rebuild_daily_summary(session)
+        bump_inventory_version(session)
+        session.commit()
+    return {"items": items, "sales": sales, "days": days, "seed": seed}
+
+def _dataset_matches(path: str, dataset: dict) -> bool:
+    meta_path = f"{path}.json"
+    if not os.path.exists(path) or not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == dataset
+
+class Workload:
+    """Builds randomized requests for each scenario from the seeded catalog."""
+
+    def __init__(self, item_count: int, days: int, seed: int):
+        self.item_count = item_count
+        self.days = days
+        self.rng = random.Random(seed + 1)
+        self.message_counter = 0
+
+    def _item_id(self) -> int:
+        return self.rng.randint(1, self.item_count)
+
+    def request(self, scenario: str) -> tuple[str, str, dict]:
+        if scenario == "items":
+            if self.rng.random() < 0.2:
+                return "GET", "/items/", {"params": {"limit": 100, "name_prefix": f"item-{self.rng.randint(0, 99):02d}"}}
+            return "GET", "/items/", {"params": {"limit": 100, "cursor": self._item_id()}}
+        if scenario == "sales":
+            return "POST", "/sales/", {"json": {"item_id": self._item_id(), "quantity": 1}}
+        if scenario == "queries":
+            return "POST", "/queries/", {"json": {"customer_name": "bench", "query": f"Do you have item-{self._item_id():07d}?"}}
+        if scenario == "bot":
+            self.message_counter += 1
+            return "POST", "/bot", {"data": {
+                "Body": f"Price of item-{self._item_id():07d}?",
+                "From": "whatsapp:+15550000000",
+                "MessageSid": f"SMbench{time.time_ns()}{self.message_counter}",
+            }}
+        if scenario == "daily-report":
+            report_date = date.today() - timedelta(days=self.rng.randrange(self.days))
+            return "GET", "/daily-report/", {"params": {"date": report_date.isoformat()}}
+        raise ValueError(f"Unknown scenario {scenario}")
+
+async def run_scenario(client, workload: Workload, scenario: str, requests: int, concurrency: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        method, url, kwargs = workload.request(scenario)
+        await client.request(method, url, **kwargs)
+
+    latencies: list[float] = []
+    status_codes: dict[str, int] = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = workload.request(scenario)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            status_codes[status] = status_codes.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in status_codes.items() if not status.startswith(("2", "3")))
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": status_codes,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": to_ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            "p50": to_ms(_percentile(latencies, 0.50)),
+            "p95": to_ms(_percentile(latencies, 0.95)),
+            "p99": to_ms(_percentile(latencies, 0.99)),
+            "max": to_ms(latencies[-1]) if latencies else 0.0,
+        },
+    }
+
+async def run_benchmark(args, dataset: dict) -> dict:
+    import httpx
+    import ai_agent
+    import main
+    import notifications
+
+    ai_agent.client = StubLLM(args.llm_latency / 1000)
+    notifications.dispatcher._whatsapp = StubWhatsApp(args.notify_latency / 1000)
+    notifications.dispatcher._smtp = StubSMTP(args.notify_latency / 1000)
+
+    await main.app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            workload = Workload(dataset["items"], dataset["days"], dataset["seed"])
+            for scenario in args.scenarios:
+                results[scenario] = await run_scenario(client, workload, scenario, args.requests, args.concurrency, args.warmup)
+                summary = results[scenario]
+                print(
+                    f"{scenario:>13}: {summary['throughput_rps']:>9} req/s  "
+                    f"p50 {summary['latency_ms']['p50']:>8}ms  p95 {summary['latency_ms']['p95']:>8}ms  "
+                    f"p99 {summary['latency_ms']['p99']:>8}ms  errors {summary['errors']}"
+                )
+    finally:
+        await main.app.router.shutdown()
+    return results
+
+def compare(previous: dict, current: dict) -> None:
+    print(f"\nCompared with {previous['meta'].get('commit') or 'previous run'}:")
+    for scenario, result in current["results"].items():
+        before = previous["results"].get(scenario)
+        if before is None:
+            continue
+        change = lambda new, old: f"{(new / old - 1) * 100:+.1f}%" if old else "n/a"
+        print(
+            f"{scenario:>13}: throughput {change(result['throughput_rps'], before['throughput_rps'])}  "
+            f"p50 {change(result['latency_ms']['p50'], before['latency_ms']['p50'])}  "
+            f"p99 {change(result['latency_ms']['p99'], before['latency_ms']['p99'])}"
+        )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the store API in-process.")
+    parser.add_argument("--db", default="bench.db", help="SQLite file to seed and benchmark against")
+    parser.add_argument("--items", type=int, default=1_000, help="Catalog size")
+    parser.add_argument("--sales", type=int, default=10_000, help="Sales history rows")
+    parser.add_argument("--days", type=int, default=90, help="Days of sales history")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and requests")
+    parser.add_argument("--reseed", action="store_true", help="Rebuild the database even if it matches")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS),
+                        help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=1_000, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--llm-latency", type=float, default=50, help="Stub LLM latency in ms")
+    parser.add_argument("--notify-latency", type=float, default=20, help="Stub WhatsApp/SMTP latency in ms")
+    parser.add_argument("--output", default="bench-results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    # The app modules read their configuration at import time, so the
+    # environment is set up before any of them is imported.
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("METRICS_SLOW_REQUEST_MS", "60000")
+    os.environ.setdefault("METRICS_QUERY_COUNT_WARN", "1000000")
+    os.environ["DAILY_REPORT_SCHEDULER"] = "false"
+    os.environ["RESPONSE_CACHE_DB"] = ""
+    os.environ.setdefault("ADMIN_PHONE_NUMBER", "whatsapp:+15550000001")
+
+    dataset = {"items": args.items, "sales": args.sales, "days": args.days, "seed": args.seed}
+    if args.reseed or not _dataset_matches(args.db, dataset):
+        for suffix in ("", "-wal", "-shm", ".json"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        started = time.perf_counter()
+        print(f"Seeding {args.db}: {args.items} items, {args.sales} sales over {args.days} days")
+        seed_database(args.db, args.items, args.sales, args.days, args.seed)
+        with open(f"{args.db}.json", "w") as f:
+            json.dump(dataset, f)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    results = asyncio.run(run_benchmark(args, dataset))
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "dataset": dataset,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import and_, or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_session_factory, upsert_insert
+from models import BotMessage, CustomerQuery
+from inventory import inventory_cache
+from ai_agent import process_customer_query
+from notifications import send_whatsapp_notification
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+# Workers are woken on enqueue; polling only picks up messages queued by
+# other processes or released after a crash.
+BOT_POLL_INTERVAL = float(os.getenv("BOT_POLL_INTERVAL", "2"))
+# A message claimed longer ago than this is assumed abandoned and re-queued.
+BOT_CLAIM_TIMEOUT = float(os.getenv("BOT_CLAIM_TIMEOUT", "300"))
+BOT_MAX_ATTEMPTS = int(os.getenv("BOT_MAX_ATTEMPTS", "3"))
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+async def enqueue_message(session: AsyncSession, message_sid: Optional[str], sender: str, body: str) -> bool:
+    """Queue an incoming message; returns False if its MessageSid was already queued."""
+    statement = upsert_insert(session.bind.dialect.name, BotMessage).values(
+        message_sid=message_sid,
+        sender=sender,
+        body=body,
+        status=STATUS_PENDING,
+        attempts=0,
+        created_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=[BotMessage.message_sid])
+    result = await session.exec(statement)
+    await session.commit()
+    return result.rowcount == 1
+
+async def claim_next_message(session: AsyncSession):
+    """Atomically mark the oldest claimable message as processing and return it."""
+    now = datetime.utcnow()
+    claimable = or_(
+        BotMessage.status == STATUS_PENDING,
+        and_(BotMessage.status == STATUS_PROCESSING, BotMessage.claimed_at < now - timedelta(seconds=BOT_CLAIM_TIMEOUT)),
+    )
+    candidate = select(BotMessage.id).where(claimable).order_by(BotMessage.id).limit(1).scalar_subquery()
+    # Re-checking `claimable` in the UPDATE makes the claim a compare-and-set,
+    # so two workers can never take the same message.
+    statement = (
+        update(BotMessage)
+        .where(BotMessage.id == candidate, claimable)
+        .values(status=STATUS_PROCESSING, attempts=BotMessage.attempts + 1, claimed_at=now)
+        .returning(BotMessage.id, BotMessage.sender, BotMessage.body, BotMessage.response, BotMessage.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await session.exec(statement)).first()
+    await session.commit()
+    return row
+
+async def _set_message(session: AsyncSession, message_id: int, **values) -> None:
+    await session.exec(
+        update(BotMessage).where(BotMessage.id == message_id).values(**values).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+async def process_message(message) -> None:
+    async with async_session_factory() as session:
+        response = message.response
+        if response is None:
+            inventory = await inventory_cache.get(session)
+            response = await process_customer_query(message.body, inventory)
+            # The answer is stored with the message, so a failed delivery is
+            # retried without asking the model again.
+            session.add(CustomerQuery(customer_name=message.sender, query=message.body, response=response))
+            await _set_message(session, message.id, response=response)
+        try:
+            await send_whatsapp_notification(response, to_number=message.sender)
+        except Exception as e:
+            status = STATUS_FAILED if message.attempts >= BOT_MAX_ATTEMPTS else STATUS_PENDING
+            logger.error("Reply delivery for bot message %s failed (attempt %s): %s", message.id, message.attempts, e)
+            await _set_message(session, message.id, status=status, error=str(e))
+            return
+        await _set_message(session, message.id, status=STATUS_DONE, error=None)
+        logger.info("Bot message %s answered", message.id)
+
+class BotWorkerPool:
+    """Async workers that drain the BotMessage queue."""
+
+    def __init__(self, workers: int = BOT_WORKERS):
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(n)) for n in range(self.workers)]
+        logger.info("Started %s bot workers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self, worker: int) -> None:
+        while True:
+            # Cleared before claiming, so a message queued after this point
+            # either gets claimed now or sets the event again.
+            self._wakeup.clear()
+            try:
+                async with async_session_factory() as session:
+                    message = await claim_next_message(session)
+            except Exception as e:
+                logger.error("Bot worker %s failed to claim a message: %s", worker, e)
+                message = None
+            if message is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), BOT_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await process_message(message)
+            except Exception as e:
+                logger.error("Bot worker %s failed on message %s: %s", worker, message.id, e, exc_info=True)
+
+bot_workers = BotWorkerPool()
@@ -0,0 +1,264 @@
+"""Chunked CSV/NDJSON import and streaming export.
+
+Imports read the file row by row and write BULK_CHUNK_SIZE rows per
+transaction, so memory stays bounded whatever the file size. Items are
+upserted on their case-insensitive name; sales either go through the normal
+stock-decrementing path or, with adjust_stock=False, are recorded as history.
+Exports stream rows from a server-side cursor.
+
+    python bulk.py import-items catalog.csv
+    python bulk.py import-sales sales.ndjson [--history]
+    python bulk.py export-items [--format ndjson] [-o items.csv]
+    python bulk.py export-sales [--from YYYY-MM-DD] [--to YYYY-MM-DD] [-o sales.csv]
+    python bulk.py export-queries [-o queries.csv]
+"""
+from datetime import date
+from typing import Iterable, Iterator, Optional, TextIO
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+from pydantic import ValidationError
+from database import upsert_insert
+from models import CustomerQuery, ImportResult, ImportRowError, Item, ItemCreate, Sale, SaleLine, normalize_name
+from inventory import bump_inventory_version
+from sales import SALE_OK, apply_sale_batch, insert_sales
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+BULK_MAX_REPORTED_ERRORS = int(os.getenv("BULK_MAX_REPORTED_ERRORS", "100"))
+
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+ITEM_EXPORT_COLUMNS = ("id", "name", "quantity", "price", "low_stock_threshold")
+SALE_EXPORT_COLUMNS = ("id", "item_id", "name", "quantity", "total", "sale_date")
+QUERY_EXPORT_COLUMNS = ("id", "customer_name", "query", "response")
+
+def detect_format(filename: Optional[str], default: str = "csv") -> str:
+    if filename and filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if filename and filename.endswith(".csv"):
+        return "csv"
+    return default
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict]]:
+    """Yield (line number, record) pairs; blank CSV cells are dropped.
+
+    Malformed NDJSON raises ValueError naming the line; rows already yielded
+    (and chunks already committed by the importers) are unaffected.
+    """
+    if fmt == "ndjson":
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {number}: {e.msg}") from e
+        return
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, {key: value for key, value in row.items() if value not in (None, "")}
+
+def _chunks(records: Iterator, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _add_error(result: ImportResult, line: int, error) -> None:
+    result.failed += 1
+    if len(result.errors) < BULK_MAX_REPORTED_ERRORS:
+        result.errors.append(ImportRowError(line=line, error=str(error)))
+
+def _item_upsert(session: Session, update_threshold: bool):
+    statement = upsert_insert(session.get_bind().dialect.name, Item)
+    columns = {"quantity": statement.excluded.quantity, "price": statement.excluded.price, "version": Item.version + 1}
+    if update_threshold:
+        columns["low_stock_threshold"] = statement.excluded.low_stock_threshold
+    # Conflicts are detected on ix_item_name_normalized, so "Milk" in the
+    # file updates an existing "milk".
+    return statement.on_conflict_do_update(index_elements=[Item.__table__.c.name_normalized], set_=columns)
+
+def import_items(session: Session, records: Iterable[tuple[int, dict]], chunk_size: int = BULK_CHUNK_SIZE) -> ImportResult:
+    """Upsert items by name, committing every `chunk_size` rows.
+
+    Existing items get the file's quantity and price, and its
+    low_stock_threshold when that column is present.
+    """
+    result = ImportResult()
+    for chunk in _chunks(iter(records), chunk_size):
+        # Last row wins for a name repeated within the chunk; one statement
+        # may not upsert the same row twice.
+        rows_by_name = {}
+        for line, record in chunk:
+            result.processed += 1
+            try:
+                item = ItemCreate.model_validate(record)
+            except ValidationError as e:
+                _add_error(result, line, e)
+                continue
+            row = item.model_dump()
+            if "low_stock_threshold" not in record:
+                row.pop("low_stock_threshold")
+            rows_by_name[normalize_name(item.name)] = row
+        with_threshold = [row for row in rows_by_name.values() if "low_stock_threshold" in row]
+        without_threshold = [row for row in rows_by_name.values() if "low_stock_threshold" not in row]
+        if with_threshold:
+            session.exec(_item_upsert(session, True), params=with_threshold)
+        if without_threshold:
+            session.exec(_item_upsert(session, False), params=without_threshold)
+        if rows_by_name:
+            bump_inventory_version(session)
+        session.commit()
+        result.imported += len(rows_by_name)
+        logger.info("Imported %s items (%s failed so far)", result.imported, result.failed)
+    return result
+
+def import_sales(
+    session: Session,
+    records: Iterable[tuple[int, dict]],
+    adjust_stock: bool = True,
+    chunk_size: int = BULK_CHUNK_SIZE,
+) -> ImportResult:
+    """Record sales in chunks, each chunk in its own transaction.
+
+    With `adjust_stock` every line is a normal sale that decrements stock
+    and fails when stock runs out; without it the sales are inserted as
+    history and a `total` column, if present, is kept as is.
+    """
+    result = ImportResult()
+    for chunk in _chunks(iter(records), chunk_size):
+        lines, line_numbers, totals = [], [], []
+        for line, record in chunk:
+            result.processed += 1
+            try:
+                sale_line = SaleLine.model_validate(record)
+                total = float(record["total"]) if "total" in record else None
+            except ValueError as e:
+                _add_error(result, line, e)
+                continue
+            lines.append(sale_line)
+            line_numbers.append(line)
+            totals.append(total)
+        if not lines:
+            continue
+        if adjust_stock:
+            batch = apply_sale_batch(session, lines)
+        else:
+            batch = insert_sales(session, lines, totals)
+        result.imported += batch.succeeded
+        for line_result in batch.lines:
+            if line_result.status != SALE_OK:
+                _add_error(result, line_numbers[line_result.line], line_result.status)
+        logger.info("Imported %s sales (%s failed so far)", result.imported, result.failed)
+    return result
+
+def _format_rows(rows: list, columns: tuple, fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def _stream(engine: Engine, statement, columns: tuple, fmt: str, chunk_size: int) -> Iterator[str]:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue()
+    # stream_results asks the driver for a server-side cursor where it has
+    # one; rows are fetched and formatted chunk_size at a time.
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(statement)
+        for rows in result.partitions():
+            yield _format_rows(rows, columns, fmt)
+
+def export_items(engine: Engine, fmt: str = "csv", chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[str]:
+    statement = select(*[getattr(Item, column) for column in ITEM_EXPORT_COLUMNS]).order_by(Item.id)
+    return _stream(engine, statement, ITEM_EXPORT_COLUMNS, fmt, chunk_size)
+
+def export_sales(
+    engine: Engine,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    fmt: str = "csv",
+    chunk_size: int = BULK_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Sales in [start, end] with item names, in a shape import_sales reads back."""
+    statement = (
+        select(Sale.id, Sale.item_id, Item.name, Sale.quantity, Sale.total, Sale.sale_date)
+        .join(Item, Item.id == Sale.item_id)
+        .order_by(Sale.id)
+    )
+    if start:
+        statement = statement.where(Sale.sale_date >= start)
+    if end:
+        statement = statement.where(Sale.sale_date <= end)
+    return _stream(engine, statement, SALE_EXPORT_COLUMNS, fmt, chunk_size)
+
+def export_queries(engine: Engine, fmt: str = "csv", chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[str]:
+    statement = select(*[getattr(CustomerQuery, column) for column in QUERY_EXPORT_COLUMNS]).order_by(CustomerQuery.id)
+    return _stream(engine, statement, QUERY_EXPORT_COLUMNS, fmt, chunk_size)
+
+def _write(chunks: Iterator[str], output: TextIO) -> None:
+    for chunk in chunks:
+        output.write(chunk)
+
+if __name__ == "__main__":
+    from database import engine, create_db_and_tables
+    from logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Bulk import and export of items, sales and customer queries.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("import-items", "import-sales"):
+        command = commands.add_parser(name)
+        command.add_argument("file", help="CSV or NDJSON file; '-' reads stdin")
+        command.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, else CSV")
+    commands.choices["import-sales"].add_argument(
+        "--history", action="store_true", help="Record the sales without decrementing stock")
+    for name in ("export-items", "export-sales", "export-queries"):
+        command = commands.add_parser(name)
+        command.add_argument("--format", choices=FORMATS, default="csv")
+        command.add_argument("-o", "--output", help="Output file (default stdout)")
+    commands.choices["export-sales"].add_argument("--from", dest="start", type=date.fromisoformat)
+    commands.choices["export-sales"].add_argument("--to", dest="end", type=date.fromisoformat)
+    args = parser.parse_args()
+    configure_logging()
+    create_db_and_tables()
+
+    if args.command.startswith("import-"):
+        fmt = args.format or detect_format(args.file)
+        source = sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")
+        try:
+            with Session(engine) as session:
+                if args.command == "import-items":
+                    result = import_items(session, iter_records(source, fmt))
+                else:
+                    result = import_sales(session, iter_records(source, fmt), adjust_stock=not args.history)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(result.model_dump_json(indent=2))
+    else:
+        if args.command == "export-items":
+            chunks = export_items(engine, args.format)
+        elif args.command == "export-sales":
+            chunks = export_sales(engine, args.start, args.end, args.format)
+        else:
+            chunks = export_queries(engine, args.format)
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as output:
+                _write(chunks, output)
+        else:
+            _write(chunks, sys.stdout)
@@ -0,0 +1,235 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from sqlalchemy import and_, or_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_session_factory, upsert_insert
+from models import DailyReport
+from reports import build_daily_report
+from ai_agent import summarize_report
+from notifications import dispatcher as notification_dispatcher
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Local wall-clock time (HH:MM) at which the day's report is built and sent.
+DAILY_REPORT_TIME = os.getenv("DAILY_REPORT_TIME", "21:00")
+# How long to wait before retrying a run that failed or was left to another worker.
+DAILY_REPORT_RETRY_INTERVAL = float(os.getenv("DAILY_REPORT_RETRY_INTERVAL", "300"))
+# A report claimed longer ago than this is assumed abandoned and can be rebuilt.
+DAILY_REPORT_CLAIM_TIMEOUT = float(os.getenv("DAILY_REPORT_CLAIM_TIMEOUT", "600"))
+# How long a request waits for another run that is building the same report.
+DAILY_REPORT_WAIT = float(os.getenv("DAILY_REPORT_WAIT", "30"))
+DAILY_REPORT_POLL_INTERVAL = 0.25
+
+STATUS_GENERATING = "generating"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+# Built on demand for a day that is not over yet; returned but never stored.
+STATUS_PROVISIONAL = "provisional"
+
+async def claim_report(session: AsyncSession, report_date: date, regenerate: bool = False) -> bool:
+    """Take the right to build the report for `report_date`; False if another run has it or it is done."""
+    now = datetime.utcnow()
+    inserted = await session.exec(
+        upsert_insert(session.bind.dialect.name, DailyReport)
+        .values(report_date=report_date, status=STATUS_GENERATING, claimed_at=now)
+        .on_conflict_do_nothing(index_elements=[DailyReport.report_date])
+    )
+    if inserted.rowcount == 1:
+        await session.commit()
+        return True
+    claimable = or_(
+        DailyReport.status == STATUS_FAILED,
+        and_(DailyReport.status == STATUS_GENERATING, DailyReport.claimed_at < now - timedelta(seconds=DAILY_REPORT_CLAIM_TIMEOUT)),
+    )
+    if regenerate:
+        claimable = or_(claimable, DailyReport.status == STATUS_READY)
+    # Compare-and-set, as for bot messages: only one run wins the claim.
+    result = await session.exec(
+        update(DailyReport)
+        .where(DailyReport.report_date == report_date, claimable)
+        .values(status=STATUS_GENERATING, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+async def _set_report(session: AsyncSession, report_date: date, **values) -> None:
+    await session.exec(
+        update(DailyReport).where(DailyReport.report_date == report_date).values(**values).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+async def get_report(session: AsyncSession, report_date: date) -> Optional[DailyReport]:
+    return await session.get(DailyReport, report_date, populate_existing=True)
+
+async def _build_report(session: AsyncSession, report_date: date) -> tuple[str, str]:
+    raw_report = await build_daily_report(session, report_date)
+    return raw_report, await summarize_report(raw_report)
+
+async def _build_claimed_report(session: AsyncSession, report_date: date) -> None:
+    try:
+        raw_report, report = await _build_report(session, report_date)
+    except Exception as e:
+        logger.error("Daily report for %s failed: %s", report_date, e, exc_info=True)
+        await _set_report(session, report_date, status=STATUS_FAILED, error=str(e))
+        raise
+    await _set_report(
+        session, report_date,
+        status=STATUS_READY, report=report, raw_report=raw_report, generated_at=datetime.utcnow(), error=None,
+    )
+    logger.info("Daily report for %s stored", report_date)
+
+async def _wait_for_report(session: AsyncSession, report_date: date) -> Optional[DailyReport]:
+    # Polls the row rather than waiting in-process, so it also covers a
+    # claim held by another worker.
+    deadline = asyncio.get_running_loop().time() + DAILY_REPORT_WAIT
+    while True:
+        # End the read transaction so the next read sees the other run's commit.
+        await session.rollback()
+        report = await get_report(session, report_date)
+        if report is None or report.status != STATUS_GENERATING or asyncio.get_running_loop().time() >= deadline:
+            return report
+        await asyncio.sleep(DAILY_REPORT_POLL_INTERVAL)
+
+async def generate_report(session: AsyncSession, report_date: date, regenerate: bool = False) -> Optional[DailyReport]:
+    """Build and store the report for `report_date` unless it already exists.
+
+    With `regenerate` a stored report is rebuilt; its previous text keeps being
+    served until the new one is written. When another run holds the claim,
+    waits up to DAILY_REPORT_WAIT for it and returns the row as it then is,
+    which may still be empty. Only for days that are over: today's report is
+    left to the scheduled job (see provisional_report).
+    """
+    if not await claim_report(session, report_date, regenerate):
+        return await _wait_for_report(session, report_date)
+    await _build_claimed_report(session, report_date)
+    return await get_report(session, report_date)
+
+def _end_of_day_utc(report_date: date) -> datetime:
+    # generated_at is naive UTC; the day itself ends at local midnight.
+    return datetime.combine(report_date + timedelta(days=1), time()).astimezone(timezone.utc).replace(tzinfo=None)
+
+def covers_full_day(report: DailyReport) -> bool:
+    """False for a copy built before its day was over, e.g. by the DAILY_REPORT_TIME run."""
+    return report.generated_at is not None and report.generated_at >= _end_of_day_utc(report.report_date)
+
+async def past_report(session: AsyncSession, report_date: date, regenerate: bool = False) -> Optional[DailyReport]:
+    """The stored report for a day that is over, built (and stored) if needed.
+
+    The scheduled run sends the report at DAILY_REPORT_TIME, before the day
+    ends; that copy is rebuilt once on the first read after midnight so the
+    stored report covers the whole day. Notifications are not re-sent.
+    """
+    report = None if regenerate else await get_report(session, report_date)
+    if report is not None and report.report is not None and covers_full_day(report):
+        return report
+    logger.info("Generating daily report for %s", report_date)
+    stale = report is not None and report.status == STATUS_READY
+    return await generate_report(session, report_date, regenerate=regenerate or stale)
+
+async def provisional_report(session: AsyncSession, report_date: date, summarize: bool = False) -> DailyReport:
+    """Today's report so far, built for the caller without being stored.
+
+    Storing it would let the scheduled job mistake a partial day for the
+    finished report and send it. Only the aggregate is returned unless
+    `summarize` is set: readers polling the day's figures should not cost a
+    model call each.
+    """
+    raw_report = await build_daily_report(session, report_date)
+    report = await summarize_report(raw_report) if summarize else raw_report
+    return DailyReport(
+        report_date=report_date, status=STATUS_PROVISIONAL, report=report, raw_report=raw_report, generated_at=datetime.utcnow(),
+    )
+
+async def notify_report(session: AsyncSession, report_date: date) -> bool:
+    """Send the stored report once; returns False if it was already sent or claimed."""
+    claimed = await session.exec(
+        update(DailyReport)
+        .where(DailyReport.report_date == report_date, DailyReport.report.is_not(None), DailyReport.notified_at.is_(None))
+        .values(notified_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    if claimed.rowcount != 1:
+        return False
+    report = await get_report(session, report_date)
+    outcome = await notification_dispatcher.broadcast("Daily Store Report", report.report)
+    errors = {channel: str(error) for channel, error in outcome.items() if error is not None}
+    if len(errors) == len(outcome):
+        # Nothing went out, so release the claim for the next attempt. A
+        # partial failure is recorded but not retried, to avoid re-sending
+        # to the channel that succeeded.
+        await _set_report(session, report_date, notified_at=None, error=f"Notification failed: {errors}")
+        return False
+    await _set_report(session, report_date, error=f"Notification failed: {errors}" if errors else None)
+    logger.info("Daily report for %s sent", report_date)
+    return True
+
+async def run_daily_report(report_date: date) -> bool:
+    """Build, store and send the report for `report_date`; True once it has been sent.
+
+    Safe to call repeatedly and from several processes: the report is built
+    by whichever run claims it first and the notifications go out once. A
+    stored copy that has not been sent yet is always rebuilt first, since it
+    may predate the end of the day.
+    """
+    async with async_session_factory() as session:
+        report = await get_report(session, report_date)
+        if report is not None and report.notified_at is not None:
+            return True
+        if not await claim_report(session, report_date, regenerate=True):
+            # Another run is building it; the retry picks up its result.
+            return False
+        await _build_claimed_report(session, report_date)
+        await notify_report(session, report_date)
+        report = await get_report(session, report_date)
+        return report.notified_at is not None
+
+def _parse_time(value: str) -> time:
+    hour, minute = value.split(":")
+    return time(int(hour), int(minute))
+
+class DailyReportScheduler:
+    """Runs the daily report job once a day at DAILY_REPORT_TIME.
+
+    A process started after the scheduled time runs the day's job straight
+    away; the job is idempotent, so this is harmless when it already ran.
+    """
+
+    def __init__(self, run_at: str = DAILY_REPORT_TIME):
+        self.run_at = _parse_time(run_at)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        logger.info("Daily report scheduled at %s", self.run_at.strftime("%H:%M"))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now()
+            scheduled = datetime.combine(now.date(), self.run_at)
+            if now < scheduled:
+                await asyncio.sleep((scheduled - now).total_seconds())
+                continue
+            try:
+                done = await run_daily_report(now.date())
+            except Exception as e:
+                logger.error("Daily report job failed: %s", e, exc_info=True)
+                done = False
+            if done:
+                next_run = datetime.combine(now.date() + timedelta(days=1), self.run_at)
+                await asyncio.sleep((next_run - datetime.now()).total_seconds())
+            else:
+                await asyncio.sleep(DAILY_REPORT_RETRY_INTERVAL)
+
+daily_report_scheduler = DailyReportScheduler()
@@ -1,88 +1,224 @@
 import chainlit as cl
 import httpx
 from chainlit.types import ThreadDict
+from dotenv import load_dotenv
+from typing import Optional
+from logging_config import configure_logging
+import asyncio
+import importlib.util
+import json
 import logging
+import os
+import time
 
-logging.basicConfig(level=logging.DEBUG)
+load_dotenv()
+
+ITEMS_PAGE_SIZE = 500
+STORE_API_URL = os.getenv("STORE_API_URL", "http://127.0.0.1:8001")
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]") and a
+# server or proxy that speaks it; otherwise the client stays on HTTP/1.1.
+STORE_API_HTTP2 = os.getenv("STORE_API_HTTP2", "true").lower() in ("1", "true", "yes")
+STORE_API_MAX_CONNECTIONS = int(os.getenv("STORE_API_MAX_CONNECTIONS", "100"))
+STORE_API_TIMEOUT = float(os.getenv("STORE_API_TIMEOUT", "30"))
+# How long the unfiltered inventory is served from this process before it is
+# revalidated against the API's ETag.
+INVENTORY_CACHE_TTL = float(os.getenv("FRONTEND_INVENTORY_CACHE_TTL", "5"))
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
-async def fetch_items():
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """The process-wide API client; connections are kept alive across chat sessions."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=STORE_API_URL,
+            http2=STORE_API_HTTP2 and importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=STORE_API_MAX_CONNECTIONS,
+                max_keepalive_connections=STORE_API_MAX_CONNECTIONS,
+            ),
+            timeout=STORE_API_TIMEOUT,
+        )
+    return _client
+
+@cl.on_app_shutdown
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def _fetch_pages(params: dict, etag: Optional[str] = None):
+    """Follow the keyset cursor; returns (items, etag), or (None, etag) on 304."""
+    client = get_client()
+    items = []
+    params = {"limit": ITEMS_PAGE_SIZE, **params}
+    headers = {"If-None-Match": etag} if etag else {}
+    first_etag = None
+    while True:
+        response = await client.get("/items/", params=params, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        first_etag = first_etag or response.headers.get("ETag")
+        # Only the first page is conditional; its ETag stands for the whole
+        # inventory version.
+        headers = {}
+        items.extend(response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            return items, first_etag
+        params["cursor"] = next_cursor
+
+class InventoryListCache:
+    """Short-lived copy of the unfiltered item list shared by all chat sessions.
+
+    Within INVENTORY_CACHE_TTL the list is served without a request; after
+    that one conditional request revalidates it, and an unchanged inventory
+    costs a 304. Concurrent refreshes are coalesced behind a lock.
+    """
+
+    def __init__(self, ttl: float = INVENTORY_CACHE_TTL):
+        self.ttl = ttl
+        self._items: Optional[list[dict]] = None
+        self._etag: Optional[str] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._items is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self) -> list[dict]:
+        if self._fresh():
+            return self._items
+        async with self._lock:
+            if self._fresh():
+                return self._items
+            items, etag = await _fetch_pages({}, self._etag if self._items is not None else None)
+            if items is not None:
+                self._items = items
+            self._etag = etag
+            self._fetched_at = time.monotonic()
+            return self._items
+
+    def invalidate(self) -> None:
+        # Keeps the ETag, so the next read is still a conditional request.
+        self._fetched_at = 0.0
+
+    def apply_sale(self, item_id: int, quantity: int) -> None:
+        """Reflect a sale made from this process without refetching."""
+        for item in self._items or []:
+            if item["id"] == item_id and "quantity" in item:
+                item["quantity"] -= quantity
+                if "version" in item:
+                    item["version"] += 1
+                break
+
+inventory_items = InventoryListCache()
+
+async def fetch_items(**filters):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("http://127.0.0.1:8001/items/")
-            response.raise_for_status()
-            logger.debug(f"Inventory response: {response.json()}")
-            return response.json()
+        if filters:
+            items, _ = await _fetch_pages(filters)
+        else:
+            items = await inventory_items.get()
+        logger.debug("Fetched %s inventory items", len(items))
+        return items
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error fetching items: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP error fetching items: %s - %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Failed to fetch items: {str(e)}")
+        logger.error("Failed to fetch items: %s", e)
         raise
 
 async def create_item(name: str, quantity: int, price: float):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://127.0.0.1:8001/items/",
-                json={"name": name, "quantity": quantity, "price": price}
-            )
-            response.raise_for_status()
-            item = response.json()
-            logger.debug(f"Item created: {item}")
-            if not all(key in item for key in ["name", "quantity", "price"]):
-                logger.error(f"Invalid item response: {item}")
-                raise ValueError("Invalid item response from server")
-            return item
+        response = await get_client().post(
+            "/items/",
+            json={"name": name, "quantity": quantity, "price": price}
+        )
+        response.raise_for_status()
+        item = response.json()
+        logger.debug("Item created: %s", item)
+        if not all(key in item for key in ["name", "quantity", "price"]):
+            logger.error("Invalid item response: %s", item)
+            raise ValueError("Invalid item response from server")
+        inventory_items.invalidate()
+        return item
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error creating item: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP error creating item: %s - %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Failed to create item: {str(e)}")
+        logger.error("Failed to create item: %s", e)
         raise
 
 async def sell_item(name: str, quantity: int):
     try:
-        async with httpx.AsyncClient() as client:
-            # Find item by name to get item_id
-            items_response = await client.get("http://127.0.0.1:8001/items/")
-            items_response.raise_for_status()
-            items = items_response.json()
-            item = next((item for item in items if item["name"].lower() == name.lower()), None)
-            if not item:
-                raise ValueError(f"Item '{name}' not found")
-            
-            # Send sale request
-            response = await client.post(
-                "http://127.0.0.1:8001/sales/",
-                json={"item_id": item["id"], "quantity": quantity}
-            )
-            response.raise_for_status()
-            sale = response.json()
-            logger.debug(f"Sale recorded: {sale}")
-            return sale, item
+        # The API resolves the name through its index and records the sale
+        # in a single round trip.
+        response = await get_client().post(
+            "/sales/by-name",
+            json={"name": name, "quantity": quantity}
+        )
+        if response.status_code == 404:
+            raise ValueError(f"Item '{name}' not found")
+        response.raise_for_status()
+        sale = response.json()
+        logger.debug("Sale recorded: %s", sale)
+        inventory_items.apply_sale(sale["item_id"], sale["quantity"])
+        return sale, {"id": sale["item_id"], "name": sale["item_name"]}
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error selling item: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP error selling item: %s - %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Failed to sell item: {str(e)}")
+        logger.error("Failed to sell item: %s", e)
         raise
 
 async def handle_query(customer_name: str, query: str):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://127.0.0.1:8001/queries/",
-                json={"customer_name": customer_name, "query": query}
-            )
+        response = await get_client().post(
+            "/queries/",
+            json={"customer_name": customer_name, "query": query}
+        )
+        response.raise_for_status()
+        logger.debug("Query response: %s", response.json())
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        logger.error("HTTP error handling query: %s - %s", e.response.status_code, e.response.text)
+        raise
+    except Exception as e:
+        logger.error("Failed to handle query: %s", e)
+        raise
+
+async def stream_query(customer_name: str, query: str):
+    """Yield answer tokens from the API's server-sent event stream."""
+    try:
+        async with get_client().stream(
+            "POST",
+            "/queries/stream",
+            json={"customer_name": customer_name, "query": query}
+        ) as response:
             response.raise_for_status()
-            logger.debug(f"Query response: {response.json()}")
-            return response.json()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "token":
+                        yield data["token"]
+                    elif event == "error":
+                        raise RuntimeError(data["detail"])
+                    elif event == "done":
+                        logger.debug("Query response: %s", data)
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error handling query: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP error streaming query: %s", e.response.status_code)
         raise
     except Exception as e:
-        logger.error(f"Failed to handle query: {str(e)}")
+        logger.error("Failed to stream query: %s", e)
         raise
 
 @cl.on_chat_start
@@ -92,7 +228,7 @@ async def start():
 @cl.on_message
 async def main(message: cl.Message):
     content = message.content.lower().strip()
-    logger.debug(f"Received message: {content}")
+    logger.debug("Received message: %s", content)
     
     if content == "inventory":
         try:
@@ -100,7 +236,7 @@ async def main(message: cl.Message):
             response = "Current Inventory:\n" + "\n".join([f"- {item['name']}: {item['quantity']} units, ${item['price']:.2f}" for item in items]) if items else "Current Inventory: Empty"
             await cl.Message(content=response).send()
         except Exception as e:
-            logger.error(f"Inventory fetch failed: {str(e)}")
+            logger.error("Inventory fetch failed: %s", e)
             await cl.Message(content="Error fetching inventory. Please try again.").send()
     
     elif content.startswith("add "):
@@ -111,10 +247,10 @@ async def main(message: cl.Message):
             item = await create_item(name, quantity, price)
             await cl.Message(content=f"Added {item['name']} with {item['quantity']} units at ${item['price']:.2f}").send()
         except ValueError as e:
-            logger.error(f"Invalid input: {str(e)}")
+            logger.error("Invalid input: %s", e)
             await cl.Message(content="Invalid format. Use: add <name> <quantity> <price>").send()
         except Exception as e:
-            logger.error(f"Add item failed: {str(e)}")
+            logger.error("Add item failed: %s", e)
             await cl.Message(content=f"Error adding item: {str(e)}").send()
     
     elif content.startswith("sell "):
@@ -124,16 +260,18 @@ async def main(message: cl.Message):
             sale, item = await sell_item(name, quantity)
             await cl.Message(content=f"Sold {quantity} units of {item['name']} for ${sale['total']:.2f}").send()
         except ValueError as e:
-            logger.error(f"Invalid input: {str(e)}")
+            logger.error("Invalid input: %s", e)
             await cl.Message(content=f"Invalid format or item not found: {str(e)}. Use: sell <name> <quantity>").send()
         except Exception as e:
-            logger.error(f"Sell item failed: {str(e)}")
+            logger.error("Sell item failed: %s", e)
             await cl.Message(content=f"Error selling item: {str(e)}").send()
     
     else:
         try:
-            query_response = await handle_query("User", content)
-            await cl.Message(content=query_response["response"]).send()
+            reply = cl.Message(content="")
+            async for token in stream_query("User", content):
+                await reply.stream_token(token)
+            await reply.send()
         except Exception as e:
-            logger.error(f"Query failed: {str(e)}")
+            logger.error("Query failed: %s", e)
             await cl.Message(content="Error processing query. Please try again.").send()
\ No newline at end of file
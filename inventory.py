@@ -0,0 +1,228 @@
+from sqlalchemy import bindparam, event, literal_column, table, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import InventoryVersion, Item, inventory_version_seq, normalize_name
+from metrics import register_cache
+from typing import Optional
+import asyncio
+import os
+import re
+import time
+
+# Readers tell whether the inventory changed from a single version number.
+# On SQLite it is a one-row counter bumped in the same transaction as every
+# write that changes item rows; writes are serialised there anyway. Elsewhere
+# that row's lock would serialise every write across all items until commit,
+# so the version is a sequence advanced right after the write commits.
+# Advancing it before commit could let a reader pair the new version with
+# the old rows and cache them under it.
+INVENTORY_VERSION_ID = 1
+
+def _uses_version_row(session: Session) -> bool:
+    return session.get_bind().dialect.name == "sqlite"
+
+def get_inventory_version(session: Session) -> int:
+    if not _uses_version_row(session):
+        row = session.connection().execute(
+            select(literal_column("last_value"), literal_column("is_called")).select_from(table(inventory_version_seq.name))
+        ).one()
+        return row.last_value if row.is_called else 0
+    row = session.get(InventoryVersion, INVENTORY_VERSION_ID)
+    return row.version if row else 0
+
+def bump_inventory_version(session: Session) -> None:
+    if not _uses_version_row(session):
+        session.info["bump_inventory_version"] = True
+        return
+    result = session.exec(
+        update(InventoryVersion)
+        .where(InventoryVersion.id == INVENTORY_VERSION_ID)
+        .values(version=InventoryVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(InventoryVersion(id=INVENTORY_VERSION_ID, version=1))
+
+@event.listens_for(OrmSession, "after_commit")
+def _advance_inventory_sequence(session: OrmSession) -> None:
+    if session.info.pop("bump_inventory_version", False):
+        # The session's own transaction is over; nextval is not
+        # transactional, so a short autocommit connection is enough.
+        with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(select(inventory_version_seq.next_value()))
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_inventory_bump(session: OrmSession) -> None:
+    session.info.pop("bump_inventory_version", None)
+
+# Outcomes of update_item_fields and adjust_item_stock.
+ITEM_OK = "ok"
+ITEM_NOT_FOUND = "not_found"
+ITEM_VERSION_MISMATCH = "version_mismatch"
+ITEM_INSUFFICIENT_STOCK = "insufficient_stock"
+
+_item_table = Item.__table__
+
+# The delta is applied by the database, so concurrent adjustments of the same
+# item all land without a read-modify-write race or a lock on the row.
+_ADJUST_STOCK = (
+    update(_item_table)
+    .where(_item_table.c.id == bindparam("item_id"), _item_table.c.quantity + bindparam("delta") >= 0)
+    .values(quantity=_item_table.c.quantity + bindparam("delta"), version=_item_table.c.version + 1)
+    .returning(*_item_table.c)
+)
+
+def _item_exists(session: Session, item_id: int) -> bool:
+    return session.connection().execute(select(_item_table.c.id).where(_item_table.c.id == item_id)).first() is not None
+
+def update_item_fields(
+    session: Session, item_id: int, values: dict, expected_versions: Optional[list[int]] = None
+) -> tuple[Optional[Item], str]:
+    """Write `values` to an item in one conditional UPDATE and commit.
+
+    Only the given columns are set and the version is incremented in the same
+    statement. With `expected_versions` the row is only updated while its
+    version is one of them, so an edit based on a stale read is refused
+    (ITEM_VERSION_MISMATCH) rather than overwriting a newer write.
+    """
+    conditions = [_item_table.c.id == item_id]
+    if expected_versions is not None:
+        conditions.append(_item_table.c.version.in_(expected_versions))
+    if "name" in values:
+        values = {**values, "name_normalized": normalize_name(values["name"])}
+    if values:
+        statement = update(_item_table).where(*conditions).values(**values, version=_item_table.c.version + 1).returning(*_item_table.c)
+    else:
+        statement = select(_item_table).where(*conditions)
+    row = session.connection().execute(statement).first()
+    if row is None:
+        status = ITEM_VERSION_MISMATCH if _item_exists(session, item_id) else ITEM_NOT_FOUND
+        session.rollback()
+        return None, status
+    if values:
+        bump_inventory_version(session)
+    session.commit()
+    return Item.model_validate(row._mapping), ITEM_OK
+
+def adjust_item_stock(session: Session, item_id: int, delta: int) -> tuple[Optional[Item], str]:
+    """Add `delta` (negative to remove) to an item's quantity and commit.
+
+    Fails with ITEM_INSUFFICIENT_STOCK instead of taking the quantity below zero.
+    """
+    row = session.connection().execute(_ADJUST_STOCK, {"item_id": item_id, "delta": delta}).first()
+    if row is None:
+        status = ITEM_INSUFFICIENT_STOCK if _item_exists(session, item_id) else ITEM_NOT_FOUND
+        session.rollback()
+        return None, status
+    bump_inventory_version(session)
+    session.commit()
+    return Item.model_validate(row._mapping), ITEM_OK
+
+def get_item_by_name(session: Session, name: str) -> Optional[Item]:
+    # An index seek on ix_item_name_normalized.
+    statement = select(Item).where(_item_table.c.name_normalized == normalize_name(name))
+    return session.exec(statement).first()
+
+# Inventories up to this size are rendered into the prompt in full; larger
+# ones only contribute the items a query mentions.
+INVENTORY_PROMPT_MAX_ITEMS = int(os.getenv("INVENTORY_PROMPT_MAX_ITEMS", "200"))
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", "60"))
+
+def _render_item(name: str, quantity: int, price: float) -> str:
+    return f"- {name}: {quantity} units, ${price:.2f}"
+
+def _query_terms(query: str) -> list[str]:
+    words = re.findall(r"[\w'-]+", normalize_name(query))
+    # Single words plus adjacent pairs, so two-word names like "olive oil" match.
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class InventorySnapshot:
+    """Immutable view of the inventory used to ground customer answers."""
+
+    def __init__(self, version: int, rows: list):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.items_by_name = {normalize_name(row.name): row for row in rows}
+        self.fragment = "\n".join(_render_item(row.name, row.quantity, row.price) for row in rows[:INVENTORY_PROMPT_MAX_ITEMS])
+        self.complete = len(rows) <= INVENTORY_PROMPT_MAX_ITEMS
+
+    def lookup(self, name: str):
+        return self.items_by_name.get(normalize_name(name))
+
+    def matching_items(self, query: str) -> list:
+        seen = {}
+        for term in _query_terms(query):
+            row = self.items_by_name.get(term)
+            if row is not None:
+                seen[row.name] = row
+        return list(seen.values())
+
+    def context_for(self, query: str) -> str:
+        if not self.items_by_name:
+            return "The inventory is currently empty."
+        if self.complete:
+            return self.fragment
+        matches = self.matching_items(query)
+        if not matches:
+            return "None of the items mentioned in the query are in the inventory."
+        return "\n".join(_render_item(row.name, row.quantity, row.price) for row in matches)
+
+def _load_snapshot(session: Session) -> InventorySnapshot:
+    rows = session.exec(select(Item.name, Item.quantity, Item.price).order_by(Item.name)).all()
+    return InventorySnapshot(get_inventory_version(session), rows)
+
+class InventoryCache:
+    """Process-wide inventory snapshot for the customer-query path.
+
+    Writers call invalidate() after committing; the TTL bounds staleness for
+    changes made by other worker processes.
+    """
+
+    def __init__(self, ttl: float = INVENTORY_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshot: Optional[InventorySnapshot] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, snapshot: Optional[InventorySnapshot]) -> bool:
+        return snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl
+
+    async def get(self, session: AsyncSession) -> InventorySnapshot:
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.hits += 1
+            return snapshot
+        # Only one coroutine reloads; the rest wait and reuse its snapshot.
+        async with self._lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generation
+            snapshot = await session.run_sync(_load_snapshot)
+            # A write that committed during the load may not be in this
+            # snapshot, so it is only kept if nothing invalidated meanwhile.
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._snapshot = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "version": snapshot.version if snapshot else None,
+            "items": len(snapshot.items_by_name) if snapshot else 0,
+        }
+
+inventory_cache = InventoryCache()
+register_cache("inventory", inventory_cache.stats)
@@ -0,0 +1,105 @@
+"""Process-wide logging setup.
+
+configure_logging() replaces the per-module basicConfig calls. Records are
+handed to a QueueHandler and written by a QueueListener thread, so formatting
+and stderr I/O happen on that thread rather than the event loop. Levels and
+format come from the environment:
+
+    LOG_LEVEL        root level (default INFO)
+    LOG_LEVELS       per-logger overrides, e.g. "main=DEBUG,aiosqlite=WARNING"
+    LOG_FORMAT       "text" (default) or "json", one object per line
+    LOG_SAMPLE_RATE  fraction of DEBUG records kept on sampled loggers (default 0.01)
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Chatty third-party loggers that log every statement or request at DEBUG/INFO.
+DEFAULT_LEVELS = {"aiosqlite": "WARNING", "httpx": "WARNING", "httpcore": "WARNING", "twilio": "WARNING"}
+
+# LogRecord attributes that are not user-supplied `extra` fields.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra={...}` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep a random `rate` fraction of DEBUG records; INFO and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+def sampled_logger(name: str, rate: Optional[float] = None) -> logging.Logger:
+    """A child of logger `name` for high-volume DEBUG chatter that only keeps a sample.
+
+    Business events such as sales and stock changes belong on the regular
+    logger. The level check still happens first, so a disabled DEBUG call
+    costs no more than on any other logger.
+    """
+    logger = logging.getLogger(f"{name}.sampled")
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(rate if rate is not None else float(os.getenv("LOG_SAMPLE_RATE", "0.01"))))
+    return logger
+
+def _parse_levels(value: str) -> dict[str, str]:
+    levels = {}
+    for entry in value.split(","):
+        name, _, level = entry.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging() -> None:
+    """Install the queue-backed handler on the root logger; later calls are no-ops."""
+    global _listener
+    if _listener is not None:
+        return
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    # QueueHandler merges the arguments into the message (and renders any
+    # traceback) in the calling thread; only enabled records get that far.
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in {**DEFAULT_LEVELS, **_parse_levels(os.getenv("LOG_LEVELS", ""))}.items():
+        logging.getLogger(name).setLevel(level)
@@ -1,148 +1,567 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from twilio.twiml.messaging_response import MessagingResponse
-from database import create_db_and_tables, SessionDep
-from models import Item, ItemCreate, Sale, SaleCreate, CustomerQuery, CustomerQueryCreate
-from notifications import send_whatsapp_notification, send_email_notification
-from ai_agent import process_customer_query, generate_daily_report
-from sqlmodel import select
+from database import create_db_and_tables, engine, async_engine, async_session_factory, SessionDep, AsyncSessionDep
+from models import (
+    Item, ItemCreate, ItemUpdate, StockAdjustment, SalesRangeReport, Sale, SaleCreate, SaleByNameCreate, SaleReceipt, SaleLine, SaleBatchCreate, SaleBatchResult,
+    CustomerQuery, CustomerQueryCreate, DailyReport, ImportResult, normalize_name,
+)
+from notifications import dispatcher as notification_dispatcher
+from ai_agent import process_customer_query, stream_customer_query, close_client
+from reports import build_sales_range_report
+from rollup import backfill_daily_summary_if_empty
+from bot_queue import enqueue_message, bot_workers
+from daily_reports import get_report, past_report, provisional_report, daily_report_scheduler, STATUS_READY, STATUS_FAILED
+from logging_config import configure_logging, sampled_logger
+from metrics import MetricsMiddleware, registry as metrics_registry
+from inventory import (
+    get_inventory_version, bump_inventory_version, get_item_by_name, inventory_cache,
+    update_item_fields, adjust_item_stock, ITEM_NOT_FOUND, ITEM_VERSION_MISMATCH, ITEM_INSUFFICIENT_STOCK,
+)
+from bulk import (
+    FORMATS as BULK_FORMATS, MEDIA_TYPES, detect_format, iter_records, import_items, import_sales,
+    export_items, export_sales, export_queries,
+)
+from sales import record_sale, apply_sale_batch, SALE_NOT_FOUND, SALE_INSUFFICIENT_STOCK
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from typing import Optional
 import asyncio
-from datetime import date
+import csv
+import codecs
+from datetime import date, timedelta
+import hashlib
+import json
 import logging
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
+# Per-request chatter on the hot endpoints; only a sample is kept.
+hot_logger = sampled_logger(__name__)
 
 app = FastAPI(title="Store Management System")
+app.add_middleware(MetricsMiddleware)
+
+ITEMS_PAGE_DEFAULT = 100
+ITEMS_PAGE_MAX = 1000
+ITEM_FIELDS = ("id", "name", "quantity", "price", "low_stock_threshold", "version")
+# When enabled, /bot acknowledges immediately and replies are generated and
+# delivered by background workers through the WhatsApp notification path.
+BOT_ASYNC_REPLIES = os.getenv("BOT_ASYNC_REPLIES", "").lower() in ("1", "true", "yes")
+# Builds, stores and sends the daily report at DAILY_REPORT_TIME.
+DAILY_REPORT_SCHEDULER = os.getenv("DAILY_REPORT_SCHEDULER", "true").lower() in ("1", "true", "yes")
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    with Session(engine) as session:
+        backfill_daily_summary_if_empty(session)
+
+@app.on_event("startup")
+async def start_background_workers():
+    if BOT_ASYNC_REPLIES:
+        bot_workers.start()
+    if DAILY_REPORT_SCHEDULER:
+        daily_report_scheduler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await bot_workers.stop()
+    await daily_report_scheduler.stop()
+    await close_client()
+    await notification_dispatcher.close()
+    await async_engine.dispose()
 
 @app.post("/items/", response_model=Item)
-async def create_item(item: ItemCreate, session: SessionDep):
+async def create_item(item: ItemCreate, session: AsyncSessionDep):
     try:
         db_item = Item(**item.dict())
         session.add(db_item)
-        session.commit()
-        session.refresh(db_item)
-        logger.debug(f"Created item: {db_item.name}, Quantity: {db_item.quantity}, Price: ${db_item.price:.2f}")
+        await session.run_sync(bump_inventory_version)
+        await session.commit()
+        inventory_cache.invalidate()
+        await session.refresh(db_item)
+        logger.debug("Created item: %s, Quantity: %s, Price: $%.2f", db_item.name, db_item.quantity, db_item.price)
         return db_item
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail=f"Item '{item.name}' already exists")
     except Exception as e:
-        logger.error(f"Error creating item: {str(e)}")
+        logger.error("Error creating item: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create item")
 
-@app.get("/items/", response_model=list[Item])
-async def read_items(session: SessionDep):
+def _parse_item_fields(fields: Optional[str]) -> list[str]:
+    if not fields:
+        return list(ITEM_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in ITEM_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [f for f in ITEM_FIELDS if f in requested]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+@app.get("/items/")
+async def read_items(
+    request: Request,
+    session: AsyncSessionDep,
+    cursor: Optional[int] = Query(None, description="Return items with an id greater than this value"),
+    limit: int = Query(ITEMS_PAGE_DEFAULT, ge=1, le=ITEMS_PAGE_MAX),
+    name_prefix: Optional[str] = None,
+    min_quantity: Optional[int] = None,
+    max_quantity: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated list of item fields to return"),
+):
     try:
-        items = session.exec(select(Item)).all()
-        logger.debug(f"Fetched items: {[item.name for item in items]}")
-        return items
+        requested = _parse_item_fields(fields)
+        # The cursor is derived from the id, so it is always selected.
+        columns = requested if "id" in requested else ["id"] + requested
+        # The ETag covers both the inventory state and the exact query, so an
+        # unchanged inventory is answered without reading any item rows.
+        version = await session.run_sync(get_inventory_version)
+        query_key = hashlib.sha1(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:16]
+        etag = f'W/"inv-{version}-{query_key}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        statement = select(*[getattr(Item, c) for c in columns])
+        if cursor is not None:
+            statement = statement.where(Item.id > cursor)
+        if name_prefix:
+            # A range over name_normalized can use its index, unlike LIKE.
+            prefix = normalize_name(name_prefix)
+            name_key = Item.__table__.c.name_normalized
+            statement = statement.where(name_key >= prefix, name_key < prefix + "\U0010ffff")
+        if min_quantity is not None:
+            statement = statement.where(Item.quantity >= min_quantity)
+        if max_quantity is not None:
+            statement = statement.where(Item.quantity <= max_quantity)
+        if min_price is not None:
+            statement = statement.where(Item.price >= min_price)
+        if max_price is not None:
+            statement = statement.where(Item.price <= max_price)
+        # Fetch one extra row to learn whether another page exists.
+        rows = (await session.exec(statement.order_by(Item.id).limit(limit + 1))).all()
+        page = [{c: row._mapping[c] for c in requested} for row in rows[:limit]]
+
+        headers = {"ETag": etag}
+        if len(rows) > limit:
+            next_cursor = rows[limit - 1].id
+            headers["X-Next-Cursor"] = str(next_cursor)
+            headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        hot_logger.debug("Fetched %s items (cursor=%s, limit=%s)", len(page), cursor, limit)
+        return JSONResponse(content=page, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching items: {str(e)}")
+        logger.error("Error fetching items: %s", e)
         raise HTTPException(status_code=500, detail="Failed to fetch items")
 
-@app.put("/items/{item_id}", response_model=Item)
-async def update_item(item_id: int, item: ItemCreate, session: SessionDep):
+@app.get("/items/by-name/{name}", response_model=Item)
+async def read_item_by_name(name: str, response: Response, session: AsyncSessionDep):
     try:
-        db_item = session.get(Item, item_id)
-        if not db_item:
+        item = await session.run_sync(get_item_by_name, name)
+        if not item:
             raise HTTPException(status_code=404, detail="Item not found")
-        for key, value in item.dict().items():
-            setattr(db_item, key, value)
-        session.add(db_item)
-        session.commit()
-        session.refresh(db_item)
-        logger.debug(f"Updated item: {db_item.name}")
+        response.headers["ETag"] = _item_etag(item)
+        return item
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error fetching item by name: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to fetch item")
+
+def _item_etag(item: Item) -> str:
+    return f'"item-{item.id}-v{item.version}"'
+
+def _if_match_versions(if_match: Optional[str], item_id: int) -> Optional[list[int]]:
+    """Item versions named by an If-Match header; None when any version will do.
+
+    If-Match uses strong comparison, so weak or foreign tags match nothing.
+    """
+    if not if_match:
+        return None
+    candidates = [tag.strip() for tag in if_match.split(",")]
+    if "*" in candidates:
+        return None
+    prefix = f'"item-{item_id}-v'
+    return [
+        int(tag[len(prefix):-1]) for tag in candidates
+        if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix):-1].isdigit()
+    ]
+
+def _item_write_result(db_item: Optional[Item], status: str, response: Response) -> Item:
+    if status == ITEM_NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if status == ITEM_VERSION_MISMATCH:
+        raise HTTPException(status_code=412, detail="Item was modified by another request; fetch it again and retry")
+    if status == ITEM_INSUFFICIENT_STOCK:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    inventory_cache.invalidate()
+    response.headers["ETag"] = _item_etag(db_item)
+    return db_item
+
+@app.put("/items/{item_id}", response_model=Item)
+async def update_item(item_id: int, item: ItemCreate, request: Request, response: Response, session: AsyncSessionDep):
+    try:
+        expected = _if_match_versions(request.headers.get("if-match"), item_id)
+        db_item, status = await session.run_sync(update_item_fields, item_id, item.dict(), expected)
+        db_item = _item_write_result(db_item, status, response)
+        logger.debug("Updated item: %s (version %s)", db_item.name, db_item.version)
         return db_item
+    except HTTPException:
+        raise
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail=f"Item '{item.name}' already exists")
     except Exception as e:
-        logger.error(f"Error updating item: {str(e)}")
+        logger.error("Error updating item: %s", e)
         raise HTTPException(status_code=500, detail="Failed to update item")
 
+@app.patch("/items/{item_id}", response_model=Item)
+async def patch_item(item_id: int, item: ItemUpdate, request: Request, response: Response, session: AsyncSessionDep):
+    try:
+        expected = _if_match_versions(request.headers.get("if-match"), item_id)
+        # Only the fields present in the body are written, so concurrent
+        # edits of different fields do not undo each other.
+        changes = item.dict(exclude_unset=True, exclude_none=True)
+        db_item, status = await session.run_sync(update_item_fields, item_id, changes, expected)
+        db_item = _item_write_result(db_item, status, response)
+        logger.debug("Patched item: %s (%s)", db_item.name, ", ".join(changes) or "no changes")
+        return db_item
+    except HTTPException:
+        raise
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail=f"Item '{item.name}' already exists")
+    except Exception as e:
+        logger.error("Error patching item: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to update item")
+
+@app.post("/items/{item_id}/adjust", response_model=Item)
+async def adjust_item(item_id: int, adjustment: StockAdjustment, response: Response, session: AsyncSessionDep):
+    try:
+        if adjustment.delta == 0:
+            raise HTTPException(status_code=400, detail="Delta must be non-zero")
+        db_item, status = await session.run_sync(adjust_item_stock, item_id, adjustment.delta)
+        db_item = _item_write_result(db_item, status, response)
+        logger.info("Stock adjusted: Item %s by %+d to %s", db_item.name, adjustment.delta, db_item.quantity)
+        return db_item
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error adjusting stock: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to adjust stock")
+
+async def _record_sale_or_raise(session: AsyncSessionDep, item_id: int, quantity: int):
+    db_sale, status, item_name = await session.run_sync(record_sale, item_id, quantity)
+    if db_sale is not None:
+        inventory_cache.invalidate()
+    if status == SALE_NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if status == SALE_INSUFFICIENT_STOCK:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+    if db_sale is None:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    logger.info("Sale recorded: Item %s, Quantity: %s, Total: $%.2f", item_name, quantity, db_sale.total)
+    return db_sale, item_name
+
 @app.post("/sales/", response_model=Sale)
-async def create_sale(sale: SaleCreate, session: SessionDep):
+async def create_sale(sale: SaleCreate, session: AsyncSessionDep):
+    try:
+        db_sale, _ = await _record_sale_or_raise(session, sale.item_id, sale.quantity)
+        return db_sale
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating sale: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to create sale")
+
+@app.post("/sales/by-name", response_model=SaleReceipt)
+async def create_sale_by_name(sale: SaleByNameCreate, session: AsyncSessionDep):
     try:
-        item = session.get(Item, sale.item_id)
+        item = await session.run_sync(get_item_by_name, sale.name)
         if not item:
             raise HTTPException(status_code=404, detail="Item not found")
-        if item.quantity < sale.quantity:
-            raise HTTPException(status_code=400, detail="Insufficient stock")
-        item.quantity -= sale.quantity
-        total = sale.quantity * item.price
-        db_sale = Sale(item_id=sale.item_id, quantity=sale.quantity, total=total, sale_date=date.today())
-        session.add(db_sale)
-        session.add(item)
-        session.commit()
-        session.refresh(db_sale)
-        logger.info(f"Sale recorded: Item {item.name}, Quantity: {sale.quantity}, Total: ${total:.2f}")
-        return db_sale
+        db_sale, item_name = await _record_sale_or_raise(session, item.id, sale.quantity)
+        return SaleReceipt(**db_sale.dict(), item_name=item_name)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error creating sale: {str(e)}")
+        logger.error("Error creating sale by name: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create sale")
 
+# Batch endpoints are plain functions on the synchronous session: FastAPI runs
+# them in its threadpool, so the event loop stays free, and the per-line
+# statements skip the async driver's per-call thread handoff.
+@app.post("/sales/batch", response_model=SaleBatchResult)
+def create_sale_batch(batch: SaleBatchCreate, session: SessionDep):
+    try:
+        result = apply_sale_batch(session, batch.lines, atomic=batch.atomic)
+        if result.committed and result.succeeded:
+            inventory_cache.invalidate()
+        return result
+    except Exception as e:
+        logger.error("Error applying sale batch: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to apply sale batch")
+
+def _parse_sale_lines(upload: UploadFile) -> list[SaleLine]:
+    # POS dumps are either CSV with item_id/name, quantity[, sale_date] columns
+    # or newline-delimited JSON objects with the same keys.
+    text = codecs.iterdecode(upload.file, "utf-8")
+    return [SaleLine.model_validate(record) for _, record in iter_records(text, detect_format(upload.filename))]
+
+def _upload_records(upload: UploadFile, fmt: Optional[str]):
+    if fmt is not None and fmt not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}'")
+    # UploadFile spools large bodies to disk, so rows are read lazily from it.
+    return iter_records(codecs.iterdecode(upload.file, "utf-8"), fmt or detect_format(upload.filename))
+
+def _export_response(chunks, fmt: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+@app.post("/items/import", response_model=ImportResult)
+def import_item_file(session: SessionDep, file: UploadFile = File(...), format: Optional[str] = None):
+    """Upsert items from a CSV or NDJSON file, keyed on name."""
+    try:
+        result = import_items(session, _upload_records(file, format))
+    except HTTPException:
+        raise
+    except (ValueError, csv.Error) as e:
+        session.rollback()
+        logger.error("Invalid item import file: %s", e)
+        raise HTTPException(status_code=400, detail=f"Invalid item import file: {str(e)}")
+    except Exception as e:
+        logger.error("Error importing items: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to import items")
+    finally:
+        # Chunks committed before a failure are kept, so caches are stale either way.
+        inventory_cache.invalidate()
+    return result
+
+@app.get("/items/export")
+def export_item_file(format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    return _export_response(export_items(engine, format), format, "items")
+
+@app.post("/sales/batch/upload", response_model=SaleBatchResult)
+def upload_sale_batch(session: SessionDep, file: UploadFile = File(...), atomic: bool = False):
+    try:
+        lines = _parse_sale_lines(file)
+    except Exception as e:
+        logger.error("Invalid sale batch file: %s", e)
+        raise HTTPException(status_code=400, detail=f"Invalid sale batch file: {str(e)}")
+    try:
+        result = apply_sale_batch(session, lines, atomic=atomic)
+        if result.committed and result.succeeded:
+            inventory_cache.invalidate()
+        return result
+    except Exception as e:
+        logger.error("Error applying sale batch: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to apply sale batch")
+
+@app.post("/sales/import", response_model=ImportResult)
+def import_sale_file(
+    session: SessionDep,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    adjust_stock: bool = Query(True, description="Decrement stock like a live sale; false records history only"),
+):
+    try:
+        result = import_sales(session, _upload_records(file, format), adjust_stock=adjust_stock)
+    except HTTPException:
+        raise
+    except (ValueError, csv.Error) as e:
+        session.rollback()
+        logger.error("Invalid sale import file: %s", e)
+        raise HTTPException(status_code=400, detail=f"Invalid sale import file: {str(e)}")
+    except Exception as e:
+        logger.error("Error importing sales: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to import sales")
+    finally:
+        inventory_cache.invalidate()
+    return result
+
+@app.get("/sales/export")
+def export_sale_file(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+):
+    return _export_response(export_sales(engine, start, end, format), format, "sales")
+
+@app.get("/queries/export")
+def export_query_file(format: str = Query("csv", pattern="^(csv|ndjson)$")):
+    return _export_response(export_queries(engine, format), format, "queries")
+
 @app.post("/queries/", response_model=CustomerQuery)
-async def handle_query(query: CustomerQueryCreate, session: SessionDep):
+async def handle_query(query: CustomerQueryCreate, session: AsyncSessionDep):
     try:
-        response = await process_customer_query(query.query)
+        inventory = await inventory_cache.get(session)
+        response = await process_customer_query(query.query, inventory)
         db_query = CustomerQuery(**query.dict(), response=response)
         session.add(db_query)
-        session.commit()
-        session.refresh(db_query)
-        logger.debug(f"Query processed: {query.query}")
+        await session.commit()
+        await session.refresh(db_query)
+        hot_logger.debug("Query processed: %s", query.query)
         return db_query
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error("Error processing query: %s", e)
         raise HTTPException(status_code=500, detail="Failed to process query")
 
-@app.get("/daily-report/")
-async def daily_report(session: SessionDep):
-    logger.info("Starting daily report generation")
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/queries/stream")
+async def stream_query(query: CustomerQueryCreate, session: AsyncSessionDep):
+    """Answer a query as server-sent events.
+
+    Emits `token` events ({"token": ...}) as the answer is generated, then one
+    `done` event carrying the stored CustomerQuery, or `error` on failure.
+    """
     try:
-        report = await generate_daily_report(session)
-        logger.info(f"Report generated: {report}")
-        
-        # Attempt WhatsApp notification
-        try:
-            await send_whatsapp_notification(report)
-            logger.info("WhatsApp notification sent successfully")
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp notification: {str(e)}", exc_info=True)
-        
-        # Attempt email notification
+        inventory = await inventory_cache.get(session)
+    except Exception as e:
+        logger.error("Error processing query: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to process query")
+
+    async def events():
+        started = time.perf_counter()
+        parts = []
         try:
-            recipient = os.getenv("SMTP_USERNAME")
-            logger.debug(f"Sending email to recipient: {recipient}")
-            await send_email_notification("Daily Store Report", report, recipient_email=recipient)
-            logger.info("Email notification sent successfully")
+            async for token in stream_customer_query(query.query, inventory):
+                if not parts:
+                    hot_logger.debug("Query stream first token after %.0fms", (time.perf_counter() - started) * 1000)
+                parts.append(token)
+                yield _sse_event("token", {"token": token})
+            # The request's session is closed once streaming begins, so the
+            # row is written through a session of its own.
+            async with async_session_factory() as write_session:
+                db_query = CustomerQuery(**query.dict(), response="".join(parts))
+                write_session.add(db_query)
+                await write_session.commit()
+                await write_session.refresh(db_query)
+            hot_logger.debug("Query streamed: %s", query.query)
+            yield _sse_event("done", db_query.model_dump(mode="json"))
         except Exception as e:
-            logger.error(f"Failed to send email notification: {str(e)}", exc_info=True)
-        
-        logger.info("Daily report processing completed")
-        return {"report": report}
+            logger.error("Error streaming query: %s", e)
+            yield _sse_event("error", {"detail": "Failed to process query"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx-style proxies from holding tokens back.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/daily-report/", response_model=DailyReport)
+async def daily_report(
+    session: AsyncSessionDep,
+    report_date: Optional[date] = Query(None, alias="date"),
+    regenerate: bool = Query(False, description="Rebuild the report with a fresh summary; notifications are not re-sent"),
+):
+    today = date.today()
+    report_date = report_date or today
+    if report_date > today:
+        raise HTTPException(status_code=400, detail="Cannot report on a future date")
+    try:
+        if report_date == today:
+            # Until the scheduled job has stored today's report, the day is
+            # still running: answer with the figures so far and store nothing.
+            # The model summary is only produced when asked for.
+            report = await get_report(session, report_date)
+            if regenerate or report is None or report.status != STATUS_READY:
+                logger.info("Building provisional daily report for %s", report_date)
+                report = await provisional_report(session, report_date, summarize=regenerate)
+            return report
+        # Past days are built on demand and stored; only the scheduled job
+        # sends notifications.
+        report = await past_report(session, report_date, regenerate=regenerate)
+        if report is not None and report.report is None and report.status == STATUS_FAILED:
+            raise HTTPException(status_code=500, detail=f"Failed to generate daily report: {report.error}")
+        if report is None or report.report is None:
+            raise HTTPException(status_code=409, detail=f"Report for {report_date} is being generated, try again shortly")
+        return report
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Daily report failed: {str(e)}", exc_info=True)
+        logger.error("Daily report failed: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to generate daily report: {str(e)}")
 
+REPORT_PERIODS = {"day", "week", "month"}
+
+@app.get("/reports/sales", response_model=SalesRangeReport)
+async def sales_report(
+    session: AsyncSessionDep,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    period: Optional[str] = Query(None, description="day, week or month ending at 'to' when 'from' is omitted"),
+):
+    end = end or date.today()
+    if start is None:
+        if period not in (None, *REPORT_PERIODS):
+            raise HTTPException(status_code=400, detail=f"Unknown period: {period}")
+        if period == "week":
+            start = end - timedelta(days=6)
+        elif period == "month":
+            start = end.replace(day=1)
+        else:
+            start = end
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    try:
+        return await build_sales_range_report(session, start, end)
+    except Exception as e:
+        logger.error("Error building sales report: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to build sales report")
+
 @app.post("/bot")
-async def bot(request: Request, session: SessionDep):
+async def bot(request: Request, session: AsyncSessionDep):
     try:
         form_data = await request.form()
-        logger.debug(f"Received form data: {form_data}")
         incoming_msg = form_data.get("Body")
         sender = form_data.get("From")
         if not incoming_msg or not sender:
-            logger.error("Missing Body or From in form data")
+            logger.error("Missing Body or From in bot message %s", form_data.get("MessageSid"))
             raise HTTPException(status_code=400, detail="Invalid request: Missing Body or From")
-        response = await process_customer_query(incoming_msg)
+        hot_logger.debug("Received bot message %s (%s chars)", form_data.get("MessageSid"), len(incoming_msg))
+        if BOT_ASYNC_REPLIES:
+            # Twilio retries a webhook with the same MessageSid; those retries
+            # are acknowledged without being queued again.
+            queued = await enqueue_message(session, form_data.get("MessageSid"), sender, incoming_msg)
+            if queued:
+                bot_workers.notify()
+            else:
+                logger.info("Duplicate bot message %s ignored", form_data.get("MessageSid"))
+            return Response(content=str(MessagingResponse()), media_type="application/xml")
+        inventory = await inventory_cache.get(session)
+        response = await process_customer_query(incoming_msg, inventory)
         db_query = CustomerQuery(customer_name=sender, query=incoming_msg, response=response)
         session.add(db_query)
-        session.commit()
+        await session.commit()
         twiml = MessagingResponse()
         twiml.message(response)
-        logger.debug(f"Sending TwiML response: {str(twiml)}")
-        return str(twiml)
+        hot_logger.debug("Sending TwiML reply (%s chars)", len(response))
+        return Response(content=str(twiml), media_type="application/xml")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in /bot endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
\ No newline at end of file
+        logger.error("Error in /bot endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
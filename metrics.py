@@ -0,0 +1,242 @@
+"""In-process metrics exported in the Prometheus text format.
+
+Counters and histograms are kept in memory per process and rendered by the
+/metrics endpoint. MetricsMiddleware times every HTTP request and, through
+instrument_engine, counts the SQL statements each request runs, so a request
+that suddenly issues hundreds of queries (an N+1 regression) shows up both in
+the per-route query histogram and in the slow-request log.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import event
+from typing import Callable, Optional
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this, or running more SQL statements than
+# METRICS_QUERY_COUNT_WARN, are logged with their query count.
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "500"))
+METRICS_QUERY_COUNT_WARN = int(os.getenv("METRICS_QUERY_COUNT_WARN", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum.
+        self._values: dict[tuple, tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class CallbackMetric:
+    """A metric whose samples are read at scrape time from `callback`.
+
+    For counts that are already kept elsewhere; `callback` returns a dict
+    mapping label value tuples to values.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str, labelnames: tuple, callback):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = labelnames
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for key, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")))
+http_request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements run per HTTP request.", ("method", "route"), QUERY_COUNT_BUCKETS))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement type.", ("operation",)))
+llm_request_duration = registry.register(Histogram(
+    "llm_request_duration_seconds", "Chat completion latency by call type and outcome.", ("call", "outcome")))
+llm_time_to_first_token = registry.register(Histogram(
+    "llm_time_to_first_token_seconds", "Delay before the first streamed token."))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "Tokens reported by the model API.", ("type",)))
+notification_duration = registry.register(Histogram(
+    "notification_send_duration_seconds", "Notification send latency by channel and outcome.", ("channel", "outcome")))
+
+# Caches register a stats() callable returning their lookup counters (any of
+# hits, persistent_hits, misses, coalesced), "entries" and "hit_rate".
+_cache_stats: dict[str, Callable[[], dict]] = {}
+CACHE_LOOKUP_RESULTS = {"hits": "hit", "persistent_hits": "persistent_hit", "misses": "miss", "coalesced": "coalesced"}
+
+def register_cache(name: str, stats: Callable[[], dict]) -> None:
+    _cache_stats[name] = stats
+
+def _cache_samples(stat: str, lookups: bool = False) -> dict:
+    samples = {}
+    for name, stats in _cache_stats.items():
+        values = stats()
+        if lookups:
+            samples.update({(name, result): values[field] for field, result in CACHE_LOOKUP_RESULTS.items() if field in values})
+        elif values.get(stat) is not None:
+            samples[(name,)] = values[stat]
+    return samples
+
+cache_lookups = registry.register(CallbackMetric(
+    "cache_lookups_total", "Cache lookups by cache and result.", "counter", ("cache", "result"),
+    lambda: _cache_samples("", lookups=True)))
+cache_hit_ratio = registry.register(CallbackMetric(
+    "cache_hit_ratio", "Share of lookups answered without recomputing.", "gauge", ("cache",),
+    lambda: _cache_samples("hit_rate")))
+cache_entries = registry.register(CallbackMetric(
+    "cache_entries", "Entries currently held in memory.", "gauge", ("cache",),
+    lambda: _cache_samples("entries")))
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_seconds: float = 0.0
+
+# Set for the duration of each HTTP request; SQL events add to it. Threads
+# running sync handlers inherit a copy of the context, which still points at
+# the same RequestStats object.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement executed on `engine` (a sync Engine)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = statement.split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        db_query_duration.observe(elapsed, operation=operation)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+        if started:
+            started.pop()
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL query count per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            # The route template, not the raw path, keeps label cardinality bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            http_requests.inc(method=method, route=route, status=status)
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_request_db_queries.observe(stats.queries, method=method, route=route)
+            if elapsed * 1000 >= METRICS_SLOW_REQUEST_MS or stats.queries > METRICS_QUERY_COUNT_WARN:
+                logger.warning(
+                    "Slow or query-heavy request %s %s (%s) -> %s: %.0fms, %s SQL statements in %.0fms",
+                    method, scope["path"], route, status, elapsed * 1000, stats.queries, stats.query_seconds * 1000,
+                )
@@ -1,29 +1,131 @@
 from sqlmodel import SQLModel, Field
-from datetime import date
+from sqlalchemy import Column, Index, Sequence, String, func
+from datetime import date, datetime
 from typing import Optional
+import unicodedata
+
+def normalize_name(name: str) -> str:
+    """The form item names are compared in: NFKC-normalised and casefolded.
+
+    Done in Python because SQL lower() differs by backend; SQLite's only
+    folds ASCII, so "Éclair" and "éclair" would count as different names.
+    """
+    return unicodedata.normalize("NFKC", name).casefold()
 
 class Item(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     quantity: int
     price: float
+    low_stock_threshold: int = Field(default=10, sa_column_kwargs={"server_default": "10"})
+    # Incremented by every write to the row; conditional updates compare it
+    # so concurrent edits cannot silently overwrite each other.
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+# normalize_name(name), filled on insert and by update_item_fields. Kept off
+# the model so API responses are unchanged. Nullable only so it can be added
+# to existing tables; create_db_and_tables backfills it.
+Item.__table__.append_column(Column(
+    "name_normalized", String, default=lambda context: normalize_name(context.get_current_parameters()["name"]),
+))
+# Case-insensitive uniqueness on item names; name lookups compare
+# normalize_name() of the input against this index.
+Index("ix_item_name_normalized", Item.__table__.c.name_normalized, unique=True)
+# Low-stock scans filter on quantity - low_stock_threshold < 0, which this
+# expression index answers without reading every item.
+Index("ix_item_stock_margin", Item.quantity - Item.low_stock_threshold)
 
 class ItemCreate(SQLModel):
     name: str
     quantity: int
     price: float
+    low_stock_threshold: int = 10
+
+class ItemUpdate(SQLModel):
+    name: Optional[str] = None
+    quantity: Optional[int] = None
+    price: Optional[float] = None
+    low_stock_threshold: Optional[int] = None
+
+class StockAdjustment(SQLModel):
+    delta: int
 
 class Sale(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    item_id: int = Field(foreign_key="item.id")
+    item_id: int = Field(foreign_key="item.id", index=True)
     quantity: int
     total: float
-    sale_date: date = Field(default_factory=date.today)
+    sale_date: date = Field(default_factory=date.today, index=True)
 
 class SaleCreate(SQLModel):
     item_id: int
     quantity: int
 
+class SaleByNameCreate(SQLModel):
+    name: str
+    quantity: int
+
+class SaleLine(SQLModel):
+    item_id: Optional[int] = None
+    name: Optional[str] = None
+    quantity: int
+    sale_date: Optional[date] = None
+
+class SaleBatchCreate(SQLModel):
+    lines: list[SaleLine]
+    atomic: bool = False
+
+class SaleLineResult(SQLModel):
+    line: int
+    status: str
+    item_id: Optional[int] = None
+    sale_id: Optional[int] = None
+    quantity: int
+    total: Optional[float] = None
+
+class SaleBatchResult(SQLModel):
+    committed: bool
+    succeeded: int
+    failed: int
+    lines: list[SaleLineResult]
+
+class SaleReceipt(SQLModel):
+    id: int
+    item_id: int
+    item_name: str
+    quantity: int
+    total: float
+    sale_date: date
+
+class DailySalesSummary(SQLModel, table=True):
+    sale_date: date = Field(primary_key=True)
+    item_id: int = Field(primary_key=True, foreign_key="item.id", index=True)
+    units: int = 0
+    revenue: float = 0.0
+    sale_count: int = 0
+
+class SalesReportItem(SQLModel):
+    item_id: int
+    name: str
+    units: int
+    revenue: float
+    sale_count: int
+
+class SalesReportDay(SQLModel):
+    sale_date: date
+    units: int
+    revenue: float
+    sale_count: int
+
+class SalesRangeReport(SQLModel):
+    start: date
+    end: date
+    units: int
+    revenue: float
+    sale_count: int
+    items: list[SalesReportItem]
+    days: list[SalesReportDay]
+
 class CustomerQuery(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     customer_name: str
@@ -32,4 +134,51 @@ class CustomerQuery(SQLModel, table=True):
 
 class CustomerQueryCreate(SQLModel):
     customer_name: str
-    query: str
\ No newline at end of file
+    query: str
+
+class InventoryVersion(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = 0
+
+# The inventory version on backends with sequences (see inventory.py);
+# create_all skips it on SQLite, which uses the InventoryVersion row.
+inventory_version_seq = Sequence("inventory_version_seq", metadata=SQLModel.metadata)
+
+
+class BotMessage(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Twilio's MessageSid; unique so webhook retries are not queued twice.
+    message_sid: Optional[str] = Field(default=None, unique=True)
+    sender: str
+    body: str
+    status: str = Field(default="pending", index=True)
+    attempts: int = 0
+    response: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    claimed_at: Optional[datetime] = None
+
+
+class DailyReport(SQLModel, table=True):
+    report_date: date = Field(primary_key=True)
+    status: str = Field(default="generating")
+    # `report` is what gets served and sent (the summary, or the raw report
+    # when the model was unavailable); `raw_report` is the aggregated text.
+    report: Optional[str] = None
+    raw_report: Optional[str] = None
+    error: Optional[str] = None
+    claimed_at: Optional[datetime] = None
+    generated_at: Optional[datetime] = None
+    notified_at: Optional[datetime] = None
+
+
+class ImportRowError(SQLModel):
+    line: int
+    error: str
+
+class ImportResult(SQLModel):
+    processed: int = 0
+    imported: int = 0
+    failed: int = 0
+    # Only the first BULK_MAX_REPORTED_ERRORS failures are listed.
+    errors: list[ImportRowError] = []
@@ -1,66 +1,251 @@
 import os
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from requests.exceptions import ConnectionError as RequestsConnectionError, ConnectTimeout
+from urllib3.exceptions import NewConnectionError
 import aiosmtplib
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
+from typing import Optional
+from metrics import notification_duration
+import asyncio
 import logging
+import random
+import time
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-async def send_whatsapp_notification(message: str):
-    logger.debug("Starting WhatsApp notification process")
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "2"))
+NOTIFY_RETRY_BASE_DELAY = float(os.getenv("NOTIFY_RETRY_BASE_DELAY", "1.0"))
+
+def _split_env(name: str) -> list[str]:
+    return [value.strip() for value in os.getenv(name, "").split(",") if value.strip()]
+
+def _twilio_retryable(error: Exception) -> bool:
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    # Only retry when no connection was made, so the request never reached
+    # Twilio. A read timeout or a connection dropped mid-request may come after
+    # the message was accepted, and sending it again would deliver it twice.
+    if isinstance(error, ConnectTimeout):
+        return True
+    if isinstance(error, RequestsConnectionError):
+        # requests wraps urllib3's MaxRetryError, whose reason says what failed.
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+_SMTP_CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError, OSError)
+
+def _smtp_retryable(error: Exception) -> bool:
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        # 4xx replies are transient by definition; 5xx will fail again.
+        return 400 <= error.code < 500
+    return isinstance(error, _SMTP_CONNECTION_ERRORS)
+
+async def _timed(channel: str, operation):
+    started = time.perf_counter()
+    outcome = "ok"
     try:
-        sid = os.getenv("TWILIO_ACCOUNT_SID")
-        token = os.getenv("TWILIO_AUTH_TOKEN")
-        from_number = os.getenv("TWILIO_PHONE_NUMBER")
-        to_number = os.getenv("ADMIN_PHONE_NUMBER")
-        logger.debug(f"Twilio config: SID={sid[:4] + '...' if sid else None}, From={from_number}, To={to_number}")
-        if not all([sid, token, from_number, to_number]):
+        return await operation()
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        notification_duration.observe(time.perf_counter() - started, channel=channel, outcome=outcome)
+
+async def _with_retries(description: str, operation, retryable=lambda error: True):
+    for attempt in range(NOTIFY_MAX_RETRIES + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == NOTIFY_MAX_RETRIES or not retryable(e):
+                raise
+            delay = random.uniform(0, NOTIFY_RETRY_BASE_DELAY * 2 ** attempt)
+            logger.warning("%s failed (%s), retrying in %.2fs", description, type(e).__name__, delay)
+            await asyncio.sleep(delay)
+
+class WhatsAppSender:
+    """Sends WhatsApp messages through one long-lived Twilio client.
+
+    The Twilio SDK is synchronous, so each API call runs in a worker thread;
+    its HTTP session keeps connections to the API open between calls.
+    `http_client` accepts any twilio.http.HttpClient, e.g. a fake transport.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, http_client=None, max_concurrency: int = 8):
+        if not all([account_sid, auth_token, from_number]):
             logger.error("Missing Twilio configuration variables")
             raise ValueError("Missing Twilio configuration")
-        
-        client = Client(sid, token)
-        twilio_message = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=to_number
+        self.from_number = from_number
+        self.client = Client(account_sid, auth_token, http_client=http_client)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _send_one(self, body: str, to_number: str) -> str:
+        async def create():
+            async with self._semaphore:
+                return await asyncio.to_thread(
+                    self.client.messages.create, body=body, from_=self.from_number, to=to_number
+                )
+        message = await _timed("whatsapp", lambda: _with_retries(f"WhatsApp message to {to_number}", create, _twilio_retryable))
+        logger.info("WhatsApp message sent: SID %s", message.sid)
+        return message.sid
+
+    async def send(self, body: str, to_numbers: list[str]) -> list[str]:
+        return list(await asyncio.gather(*(self._send_one(body, to_number) for to_number in to_numbers)))
+
+class SMTPPool:
+    """A small pool of persistent SMTP connections.
+
+    Connections are opened (and STARTTLS/AUTH negotiated) on first use and then
+    reused; a connection the server dropped is reopened on the next send.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str, password: Optional[str], start_tls: bool = True, size: int = 2):
+        if not all([hostname, port, username]):
+            logger.error("Missing SMTP configuration variables")
+            raise ValueError("Missing SMTP configuration")
+        self.sender = username
+        self._connections: asyncio.Queue = asyncio.Queue()
+        for _ in range(size):
+            self._connections.put_nowait(aiosmtplib.SMTP(
+                hostname=hostname,
+                port=int(port),
+                username=username if password else None,
+                password=password or None,
+                use_tls=False,
+                start_tls=start_tls,
+            ))
+
+    async def send(self, messages: list[MIMEText]) -> None:
+        """Send `messages` over a single pooled connection."""
+        smtp = await self._connections.get()
+        sent = 0
+        try:
+            async def send_remaining():
+                nonlocal sent
+                if not smtp.is_connected:
+                    await smtp.connect()
+                while sent < len(messages):
+                    await smtp.send_message(messages[sent])
+                    sent += 1
+
+            async def send_or_reset():
+                try:
+                    await send_remaining()
+                except _SMTP_CONNECTION_ERRORS:
+                    # Drop the broken transport; the retry reconnects and only
+                    # sends the messages that did not go out.
+                    smtp.close()
+                    raise
+
+            await _timed("email", lambda: _with_retries("SMTP send", send_or_reset, _smtp_retryable))
+        finally:
+            self._connections.put_nowait(smtp)
+
+    async def close(self) -> None:
+        while not self._connections.empty():
+            smtp = self._connections.get_nowait()
+            if smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except aiosmtplib.SMTPException:
+                    smtp.close()
+
+class NotificationDispatcher:
+    """Fans notifications out to WhatsApp and email concurrently."""
+
+    def __init__(self, whatsapp: Optional[WhatsAppSender] = None, smtp: Optional[SMTPPool] = None):
+        self._whatsapp = whatsapp
+        self._smtp = smtp
+
+    @property
+    def whatsapp(self) -> WhatsAppSender:
+        if self._whatsapp is None:
+            sid = os.getenv("TWILIO_ACCOUNT_SID")
+            logger.debug("Twilio config: SID=%s, From=%s", sid[:4] + "..." if sid else None, os.getenv("TWILIO_PHONE_NUMBER"))
+            self._whatsapp = WhatsAppSender(
+                sid,
+                os.getenv("TWILIO_AUTH_TOKEN"),
+                os.getenv("TWILIO_PHONE_NUMBER"),
+                max_concurrency=int(os.getenv("TWILIO_MAX_CONCURRENCY", "8")),
+            )
+        return self._whatsapp
+
+    @property
+    def smtp(self) -> SMTPPool:
+        if self._smtp is None:
+            logger.debug("SMTP config: Host=%s, Port=%s, User=%s", os.getenv("SMTP_HOST"), os.getenv("SMTP_PORT"), os.getenv("SMTP_USERNAME"))
+            self._smtp = SMTPPool(
+                os.getenv("SMTP_HOST"),
+                os.getenv("SMTP_PORT"),
+                os.getenv("SMTP_USERNAME"),
+                os.getenv("SMTP_PASSWORD"),
+                start_tls=os.getenv("SMTP_START_TLS", "true").lower() in ("1", "true", "yes"),
+                size=int(os.getenv("SMTP_POOL_SIZE", "2")),
+            )
+        return self._smtp
+
+    async def send_whatsapp(self, body: str, to_numbers: Optional[list[str]] = None) -> list[str]:
+        to_numbers = to_numbers or _split_env("ADMIN_PHONE_NUMBER")
+        if not to_numbers:
+            logger.error("Missing Twilio configuration variables")
+            raise ValueError("Missing Twilio configuration")
+        return await self.whatsapp.send(body, to_numbers)
+
+    async def send_emails(self, messages: list[tuple[str, str, list[str]]]) -> None:
+        """Send (subject, body, recipients) messages over one SMTP connection."""
+        smtp = self.smtp
+        mime_messages = []
+        for subject, body, recipients in messages:
+            msg = MIMEText(body)
+            msg["Subject"] = subject
+            msg["From"] = smtp.sender
+            msg["To"] = ", ".join(recipients or [smtp.sender])
+            mime_messages.append(msg)
+        await smtp.send(mime_messages)
+        logger.info("Sent %s email(s)", len(mime_messages))
+
+    async def send_email(self, subject: str, body: str, recipients: Optional[list[str]] = None) -> None:
+        await self.send_emails([(subject, body, recipients or _split_env("REPORT_EMAIL_RECIPIENTS"))])
+
+    async def broadcast(self, subject: str, body: str, whatsapp_to: Optional[list[str]] = None, email_to: Optional[list[str]] = None) -> dict:
+        """Send `body` on every channel at once; returns {channel: exception or None}."""
+        results = await asyncio.gather(
+            self.send_whatsapp(body, whatsapp_to),
+            self.send_email(subject, body, email_to),
+            return_exceptions=True,
         )
-        logger.info(f"WhatsApp message sent: SID {twilio_message.sid}")
+        outcome = {}
+        for channel, result in zip(("whatsapp", "email"), results):
+            if isinstance(result, BaseException):
+                logger.error("%s notification failed: %s", channel, result, exc_info=result)
+                outcome[channel] = result
+            else:
+                outcome[channel] = None
+        return outcome
+
+    async def close(self) -> None:
+        if self._smtp is not None:
+            await self._smtp.close()
+
+dispatcher = NotificationDispatcher()
+
+async def send_whatsapp_notification(message: str, to_number: str = None):
+    logger.debug("Starting WhatsApp notification process")
+    try:
+        await dispatcher.send_whatsapp(message, [to_number] if to_number else None)
     except Exception as e:
-        logger.error(f"WhatsApp notification failed: {str(e)}", exc_info=True)
+        logger.error("WhatsApp notification failed: %s", e, exc_info=True)
         raise
 
 async def send_email_notification(subject: str, body: str, recipient_email: str = None):
     logger.debug("Starting email notification process")
     try:
-        smtp_host = os.getenv("SMTP_HOST")
-        smtp_port = os.getenv("SMTP_PORT")
-        smtp_user = os.getenv("SMTP_USERNAME")
-        smtp_pass = os.getenv("SMTP_PASSWORD")
-        logger.debug(f"SMTP config: Host={smtp_host}, Port={smtp_port}, User={smtp_user}")
-        if not all([smtp_host, smtp_port, smtp_user, smtp_pass]):
-            logger.error("Missing SMTP configuration variables")
-            raise ValueError("Missing SMTP configuration")
-        
-        msg = MIMEText(body)
-        msg["Subject"] = subject
-        msg["From"] = smtp_user
-        msg["To"] = recipient_email if recipient_email else smtp_user
-        logger.debug(f"Sending email to {msg['To']} with subject {subject}")
-        
-        async with aiosmtplib.SMTP(
-            hostname=smtp_host,
-            port=int(smtp_port),
-            username=smtp_user,
-            password=smtp_pass,
-            use_tls=False,
-            start_tls=True
-        ) as smtp:
-            await smtp.send_message(msg)
+        await dispatcher.send_email(subject, body, [recipient_email] if recipient_email else None)
         logger.info("Email sent successfully")
     except Exception as e:
-        logger.error(f"Email notification failed: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        logger.error("Email notification failed: %s", e, exc_info=True)
+        raise
@@ -0,0 +1,83 @@
+from datetime import date
+from typing import Optional
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import DailySalesSummary, Item, SalesRangeReport, SalesReportDay, SalesReportItem
+
+async def get_sales_by_item(session: AsyncSession, start: date, end: Optional[date] = None):
+    """Units, revenue and sale count per item for [start, end], highest revenue first.
+
+    Reads the DailySalesSummary rollup, so the cost grows with days x items
+    rather than with the number of sales.
+    """
+    end = end or start
+    revenue = func.sum(DailySalesSummary.revenue).label("revenue")
+    statement = (
+        select(
+            DailySalesSummary.item_id,
+            Item.name,
+            func.sum(DailySalesSummary.units).label("units"),
+            revenue,
+            func.sum(DailySalesSummary.sale_count).label("sale_count"),
+        )
+        .join(Item, Item.id == DailySalesSummary.item_id)
+        .where(DailySalesSummary.sale_date >= start, DailySalesSummary.sale_date <= end)
+        .group_by(DailySalesSummary.item_id, Item.name)
+        .order_by(revenue.desc())
+    )
+    return (await session.exec(statement)).all()
+
+async def get_sales_by_day(session: AsyncSession, start: date, end: date):
+    statement = (
+        select(
+            DailySalesSummary.sale_date,
+            func.sum(DailySalesSummary.units).label("units"),
+            func.sum(DailySalesSummary.revenue).label("revenue"),
+            func.sum(DailySalesSummary.sale_count).label("sale_count"),
+        )
+        .where(DailySalesSummary.sale_date >= start, DailySalesSummary.sale_date <= end)
+        .group_by(DailySalesSummary.sale_date)
+        .order_by(DailySalesSummary.sale_date)
+    )
+    return (await session.exec(statement)).all()
+
+async def get_low_stock_items(session: AsyncSession):
+    """Items whose quantity is below their own low_stock_threshold."""
+    # Written against the ix_item_stock_margin expression so it is index-driven.
+    statement = (
+        select(Item.name, Item.quantity, Item.low_stock_threshold)
+        .where(Item.quantity - Item.low_stock_threshold < 0)
+        .order_by(Item.quantity)
+    )
+    return (await session.exec(statement)).all()
+
+async def build_daily_report(session: AsyncSession, report_date: Optional[date] = None) -> str:
+    report_date = report_date or date.today()
+    sales = await get_sales_by_item(session, report_date)
+    low_stock = await get_low_stock_items(session)
+
+    lines = [f"Daily Sales Report for {report_date}", "", "Sales:"]
+    lines.extend(f"- {row.name}: {row.units} units, Total: ${row.revenue:.2f}" for row in sales)
+    lines.append("")
+    lines.append(f"Total Sales: ${sum(row.revenue for row in sales):.2f}")
+    lines.append("")
+    lines.append("Low Stock Items:")
+    if low_stock:
+        lines.extend(f"- {row.name}: {row.quantity} units" for row in low_stock)
+    else:
+        lines.append("No low stock items.")
+    return "\n".join(lines) + "\n"
+
+async def build_sales_range_report(session: AsyncSession, start: date, end: date) -> SalesRangeReport:
+    items = [SalesReportItem.model_validate(row, from_attributes=True) for row in await get_sales_by_item(session, start, end)]
+    days = [SalesReportDay.model_validate(row, from_attributes=True) for row in await get_sales_by_day(session, start, end)]
+    return SalesRangeReport(
+        start=start,
+        end=end,
+        units=sum(day.units for day in days),
+        revenue=sum(day.revenue for day in days),
+        sale_count=sum(day.sale_count for day in days),
+        items=items,
+        days=days,
+    )
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    # Case, punctuation and spacing differences ("Do you have milk?" vs
+    # "do you have  milk") should not produce separate cache entries.
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+class ResponseCache:
+    """LRU/TTL cache for generated answers with single-flight computation.
+
+    Entries live in memory and, when `db_path` is given, in a SQLite file that
+    survives restarts and is shared by workers on the same host. Concurrent
+    requests for the same key wait for one computation instead of each
+    calling the model.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(query: str, inventory_version) -> str:
+        return hashlib.sha256(f"{inventory_version}:{normalize_query(query)}".encode()).hexdigest()
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created_at, response = entry
+        if time.time() - created_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _put_memory(self, key: str, response: str, created_at: float) -> None:
+        self._entries[key] = (created_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_persistent(self, key: str) -> Optional[tuple[float, str]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT created_at, response FROM response_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row
+
+    def _put_persistent(self, key: str, response: str, created_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, created_at),
+            )
+            self._db.execute("DELETE FROM response_cache WHERE created_at <= ?", (created_at - self.ttl,))
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look `key` up in both tiers without computing it; a miss is counted."""
+        response = self._get_memory(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        if self._db is not None:
+            row = await asyncio.to_thread(self._get_persistent, key)
+            if row is not None:
+                self.persistent_hits += 1
+                self._put_memory(key, row[1], row[0])
+                return row[1]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, response: str) -> None:
+        """Store a response produced outside get_or_compute, e.g. a streamed one."""
+        created_at = time.time()
+        self._put_memory(key, response, created_at)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._put_persistent, key, response, created_at)
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist cached response: %s", e)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        if self._db is not None:
+            row = await asyncio.to_thread(self._get_persistent, key)
+            if row is not None:
+                self.persistent_hits += 1
+                self._put_memory(key, row[1], row[0])
+                return row[1]
+        self.misses += 1
+        response = await compute()
+        await self.put(key, response)
+        return response
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        response = self._get_memory(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # The computation runs as its own task, so a caller that times out
+            # or disconnects does not cancel it for the others waiting on it.
+            task = asyncio.ensure_future(self._compute(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Failures are not cached; retrieving the exception here avoids
+        # "never retrieved" warnings when every caller has given up.
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.persistent_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,97 @@
+"""Maintenance of the DailySalesSummary rollup.
+
+Sales code calls add_to_daily_summary in the same transaction as the Sale
+insert, so the rollup never drifts from the raw rows. rebuild_daily_summary
+recomputes it from Sale, e.g. for databases that predate the table:
+
+    python rollup.py [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+from database import upsert_insert
+from models import DailySalesSummary, Sale
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _upsert_statement(session: Session):
+    statement = upsert_insert(session.get_bind().dialect.name, DailySalesSummary)
+    return statement.on_conflict_do_update(
+        index_elements=[DailySalesSummary.sale_date, DailySalesSummary.item_id],
+        set_={
+            "units": DailySalesSummary.units + statement.excluded.units,
+            "revenue": DailySalesSummary.revenue + statement.excluded.revenue,
+            "sale_count": DailySalesSummary.sale_count + statement.excluded.sale_count,
+        },
+    )
+
+def add_to_daily_summary(session: Session, sale_rows: list[dict]) -> None:
+    """Fold new sales into the rollup; does not commit.
+
+    `sale_rows` are dicts with item_id, quantity, total and sale_date keys, as
+    inserted into Sale. Rows are pre-aggregated so each (date, item) pair is
+    upserted once.
+    """
+    totals = defaultdict(lambda: [0, 0.0, 0])
+    for row in sale_rows:
+        bucket = totals[(row["sale_date"], row["item_id"])]
+        bucket[0] += row["quantity"]
+        bucket[1] += row["total"]
+        bucket[2] += 1
+    if not totals:
+        return
+    params = [
+        {"sale_date": sale_date, "item_id": item_id, "units": units, "revenue": revenue, "sale_count": count}
+        for (sale_date, item_id), (units, revenue, count) in totals.items()
+    ]
+    session.exec(_upsert_statement(session), params=params)
+
+def rebuild_daily_summary(session: Session, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Recompute the rollup from Sale for [start, end] (all dates by default) and commit."""
+    sale_filter = []
+    summary_filter = []
+    if start:
+        sale_filter.append(Sale.sale_date >= start)
+        summary_filter.append(DailySalesSummary.sale_date >= start)
+    if end:
+        sale_filter.append(Sale.sale_date <= end)
+        summary_filter.append(DailySalesSummary.sale_date <= end)
+    session.exec(delete(DailySalesSummary).where(*summary_filter))
+    aggregate = (
+        select(Sale.sale_date, Sale.item_id, func.sum(Sale.quantity), func.sum(Sale.total), func.count())
+        .where(*sale_filter)
+        .group_by(Sale.sale_date, Sale.item_id)
+    )
+    result = session.exec(
+        insert(DailySalesSummary).from_select(
+            ["sale_date", "item_id", "units", "revenue", "sale_count"], aggregate
+        )
+    )
+    session.commit()
+    logger.info("Rebuilt daily sales summary: %s rows", result.rowcount)
+    return result.rowcount
+
+def backfill_daily_summary_if_empty(session: Session) -> None:
+    """Populate the rollup once for databases that already hold sales."""
+    has_summary = session.exec(select(DailySalesSummary.sale_date).limit(1)).first() is not None
+    has_sales = session.exec(select(Sale.id).limit(1)).first() is not None
+    if has_sales and not has_summary:
+        rebuild_daily_summary(session)
+
+if __name__ == "__main__":
+    from database import engine, create_db_and_tables
+    from logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales rollup from raw sales.")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="First sale date to rebuild")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="Last sale date to rebuild")
+    args = parser.parse_args()
+    configure_logging()
+    create_db_and_tables()
+    with Session(engine) as session:
+        rows = rebuild_daily_summary(session, args.start, args.end)
+    print(f"Rebuilt {rows} daily summary rows")
@@ -0,0 +1,214 @@
+from datetime import date
+from typing import Optional
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import Session, select
+from models import Item, Sale, SaleLine, SaleLineResult, SaleBatchResult, normalize_name
+from inventory import bump_inventory_version
+from rollup import add_to_daily_summary
+import logging
+
+logger = logging.getLogger(__name__)
+
+NAME_LOOKUP_CHUNK = 500
+
+# Line statuses reported by apply_sale_batch.
+SALE_OK = "ok"
+SALE_NOT_FOUND = "not_found"
+SALE_INSUFFICIENT_STOCK = "insufficient_stock"
+SALE_INVALID_QUANTITY = "invalid_quantity"
+SALE_ROLLED_BACK = "rolled_back"
+
+_item_table = Item.__table__
+
+# Built once and executed on the session's connection: per-line statement
+# construction and ORM bookkeeping otherwise dominate large batches.
+_DECREMENT_STOCK = (
+    update(_item_table)
+    .where(_item_table.c.id == bindparam("item_id"), _item_table.c.quantity >= bindparam("delta"))
+    .values(quantity=_item_table.c.quantity - bindparam("delta"), version=_item_table.c.version + 1)
+    .returning(_item_table.c.name, _item_table.c.price)
+)
+_ITEM_EXISTS = select(_item_table.c.id).where(_item_table.c.id == bindparam("item_id"))
+
+def decrement_stock(session: Session, item_id: int, quantity: int):
+    """Take `quantity` units of an item in a single conditional UPDATE.
+
+    Returns the item's (name, price) row, or None when the item does not exist
+    or has fewer than `quantity` units. The stock check and the decrement are
+    one statement, so concurrent tills cannot oversell.
+    """
+    return session.connection().execute(_DECREMENT_STOCK, {"item_id": item_id, "delta": quantity}).first()
+
+def _failure_status(session: Session, item_id: int) -> str:
+    exists = session.connection().execute(_ITEM_EXISTS, {"item_id": item_id}).first()
+    return SALE_INSUFFICIENT_STOCK if exists is not None else SALE_NOT_FOUND
+
+def _resolve_names(session: Session, lines: list[SaleLine]) -> dict[str, int]:
+    # Keyed on name_normalized as stored, so lines match exactly the rows the
+    # unique index treats as the same name.
+    names = list({normalize_name(line.name) for line in lines if line.item_id is None and line.name})
+    ids_by_name = {}
+    for start in range(0, len(names), NAME_LOOKUP_CHUNK):
+        chunk = names[start:start + NAME_LOOKUP_CHUNK]
+        rows = session.connection().execute(
+            select(_item_table.c.id, _item_table.c.name_normalized).where(_item_table.c.name_normalized.in_(chunk))
+        ).all()
+        ids_by_name.update({row.name_normalized: row.id for row in rows})
+    return ids_by_name
+
+def _line_item_id(line: SaleLine, ids_by_name: dict[str, int]) -> Optional[int]:
+    if line.item_id is not None:
+        return line.item_id
+    return ids_by_name.get(normalize_name(line.name)) if line.name else None
+
+def record_sale(session: Session, item_id: int, quantity: int) -> tuple[Optional[Sale], str, Optional[str]]:
+    """Record a single sale and commit it.
+
+    Returns (sale, status, item_name); sale is None unless status is SALE_OK.
+    """
+    if quantity <= 0:
+        return None, SALE_INVALID_QUANTITY, None
+    row = decrement_stock(session, item_id, quantity)
+    if row is None:
+        status = _failure_status(session, item_id)
+        session.rollback()
+        return None, status, None
+    sale_row = {"item_id": item_id, "quantity": quantity, "total": quantity * row.price, "sale_date": date.today()}
+    db_sale = Sale(**sale_row)
+    session.add(db_sale)
+    add_to_daily_summary(session, [sale_row])
+    bump_inventory_version(session)
+    session.commit()
+    session.refresh(db_sale)
+    return db_sale, SALE_OK, row.name
+
+def _lock_items(session: Session, item_ids: set[int]) -> dict[int, list]:
+    """Lock the rows of `item_ids` for this transaction and return [quantity, price] per id.
+
+    A no-op UPDATE takes the write lock (SQLite) or the row locks (Postgres)
+    before the stock is read, so no other writer can change it until commit.
+    Ids are locked in ascending order so two batches sharing items cannot
+    each hold a row the other is waiting for.
+    """
+    ids = sorted(item_ids)
+    stock = {}
+    for start in range(0, len(ids), NAME_LOOKUP_CHUNK):
+        rows = session.connection().execute(
+            update(_item_table)
+            .where(_item_table.c.id.in_(ids[start:start + NAME_LOOKUP_CHUNK]))
+            .values(quantity=_item_table.c.quantity)
+            .returning(_item_table.c.id, _item_table.c.quantity, _item_table.c.price)
+        )
+        stock.update({row.id: [row.quantity, row.price] for row in rows})
+    return stock
+
+_SET_STOCK = (
+    update(_item_table)
+    .where(_item_table.c.id == bindparam("b_item_id"))
+    .values(quantity=bindparam("b_quantity"), version=_item_table.c.version + 1)
+)
+
+def apply_sale_batch(session: Session, lines: list[SaleLine], atomic: bool = False) -> SaleBatchResult:
+    """Apply every line of a basket or POS dump in one transaction.
+
+    Lines are applied in order, each one independently: a line that asks for
+    more than the stock left after the lines before it fails and is skipped.
+    With `atomic`, any failure rolls back the whole batch.
+
+    The touched items are locked and read once, the lines are applied in
+    memory, and the new quantities and the sales are written with one
+    executemany each, so the statement count does not grow with the lines.
+    """
+    today = date.today()
+    ids_by_name = _resolve_names(session, lines)
+    item_ids = [_line_item_id(line, ids_by_name) for line in lines]
+    stock = _lock_items(session, {item_id for item_id in item_ids if item_id is not None})
+    results = []
+    sale_rows = []
+    for index, (line, item_id) in enumerate(zip(lines, item_ids)):
+        item = stock.get(item_id)
+        status, total = SALE_OK, None
+        if item is None:
+            status = SALE_NOT_FOUND
+        elif line.quantity <= 0:
+            status = SALE_INVALID_QUANTITY
+        elif item[0] < line.quantity:
+            status = SALE_INSUFFICIENT_STOCK
+        else:
+            item[0] -= line.quantity
+            total = line.quantity * item[1]
+            sale_rows.append({"item_id": item_id, "quantity": line.quantity, "total": total, "sale_date": line.sale_date or today})
+        # Built without validation: every field comes from a validated line.
+        results.append(SaleLineResult.model_construct(
+            line=index, status=status, item_id=item_id, sale_id=None, quantity=line.quantity, total=total))
+
+    ok_results = [r for r in results if r.status == SALE_OK]
+    failed = len(results) - len(ok_results)
+    if atomic and failed:
+        session.rollback()
+        for result in ok_results:
+            result.status = SALE_ROLLED_BACK
+            result.total = None
+        logger.info("Sale batch rolled back: %s of %s lines failed", failed, len(results))
+        return SaleBatchResult(committed=False, succeeded=0, failed=len(results), lines=results)
+
+    if sale_rows:
+        sold = {row["item_id"] for row in sale_rows}
+        session.connection().execute(
+            _SET_STOCK, [{"b_item_id": item_id, "b_quantity": stock[item_id][0]} for item_id in sold])
+        _assign_sale_ids(session, sale_rows, ok_results)
+        add_to_daily_summary(session, sale_rows)
+        bump_inventory_version(session)
+    session.commit()
+    logger.info("Sale batch committed: %s lines applied, %s failed", len(ok_results), failed)
+    return SaleBatchResult(committed=True, succeeded=len(ok_results), failed=failed, lines=results)
+
+def _assign_sale_ids(session: Session, sale_rows: list[dict], ok_results: list[SaleLineResult]) -> None:
+    # RETURNING in parameter order makes SQLAlchemy fall back to one INSERT
+    # per row on SQLite, so the rows go in as multi-row INSERTs and the ids
+    # are matched back by value. Rows with equal values are interchangeable,
+    # so which of them gets which id does not matter.
+    returned = session.connection().execute(
+        insert(Sale).returning(Sale.id, Sale.item_id, Sale.quantity, Sale.sale_date), sale_rows
+    ).all()
+    ids_by_key = {}
+    for row in sorted(returned, key=lambda row: row.id, reverse=True):
+        ids_by_key.setdefault((row.item_id, row.quantity, row.sale_date), []).append(row.id)
+    for result, row in zip(ok_results, sale_rows):
+        result.sale_id = ids_by_key[(row["item_id"], row["quantity"], row["sale_date"])].pop()
+
+def insert_sales(session: Session, lines: list[SaleLine], totals: Optional[list[Optional[float]]] = None) -> SaleBatchResult:
+    """Record historical sales without touching stock, e.g. when importing history.
+
+    A line's total is taken from `totals` when given, otherwise priced at the
+    item's current price. Lines for unknown items are reported and skipped.
+    """
+    today = date.today()
+    ids_by_name = _resolve_names(session, lines)
+    item_ids = {_line_item_id(line, ids_by_name) for line in lines}
+    item_ids.discard(None)
+    prices = {}
+    id_list = list(item_ids)
+    for start in range(0, len(id_list), NAME_LOOKUP_CHUNK):
+        chunk = id_list[start:start + NAME_LOOKUP_CHUNK]
+        prices.update(session.exec(select(Item.id, Item.price).where(Item.id.in_(chunk))).all())
+    results = []
+    sale_rows = []
+    for index, line in enumerate(lines):
+        item_id = _line_item_id(line, ids_by_name)
+        result = SaleLineResult(line=index, status=SALE_OK, item_id=item_id, quantity=line.quantity)
+        if item_id not in prices:
+            result.status = SALE_NOT_FOUND
+        elif line.quantity <= 0:
+            result.status = SALE_INVALID_QUANTITY
+        else:
+            total = totals[index] if totals is not None else None
+            result.total = total if total is not None else line.quantity * prices[item_id]
+            sale_rows.append({"item_id": item_id, "quantity": line.quantity, "total": result.total, "sale_date": line.sale_date or today})
+        results.append(result)
+    if sale_rows:
+        session.exec(insert(Sale), params=sale_rows)
+        add_to_daily_summary(session, sale_rows)
+    session.commit()
+    succeeded = len(sale_rows)
+    return SaleBatchResult(committed=True, succeeded=succeeded, failed=len(results) - succeeded, lines=results)
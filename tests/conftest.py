@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+# database.py builds its engines from DATABASE_URL when first imported, so the
+# app under test is pointed at a scratch file before anything imports it.
+_app_dir = tempfile.mkdtemp(prefix="store-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_app_dir}/store.db"
+os.environ["ASYNC_DATABASE_URL"] = ""
+os.environ["DAILY_REPORT_SCHEDULER"] = "false"
+os.environ["BOT_ASYNC_REPLIES"] = "false"
+os.environ["RESPONSE_CACHE_DB"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel
+
+from database import build_engine
+from models import Item
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path}/store.db")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    with Session(engine) as session:
+        yield session
+
+@pytest.fixture
+def add_item(session):
+    def add(name: str, quantity: int = 10, price: float = 1.0) -> Item:
+        item = Item(name=name, quantity=quantity, price=price)
+        session.add(item)
+        session.commit()
+        session.refresh(item)
+        # Detached, so it keeps the values as created rather than reloading
+        # them after the commits under test.
+        session.expunge(item)
+        return item
+    return add
+
+@pytest.fixture(scope="session")
+def client():
+    from main import app
+    with TestClient(app) as client:
+        yield client
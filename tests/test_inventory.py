@@ -0,0 +1,50 @@
+from sqlmodel import select
+
+from inventory import (
+    ITEM_INSUFFICIENT_STOCK, ITEM_NOT_FOUND, ITEM_OK, ITEM_VERSION_MISMATCH,
+    adjust_item_stock, get_item_by_name, update_item_fields,
+)
+from models import Item
+
+def test_update_bumps_version(session, add_item):
+    item = add_item("milk")
+    updated, status = update_item_fields(session, item.id, {"price": 2.5})
+    assert status == ITEM_OK
+    assert (updated.price, updated.version) == (2.5, item.version + 1)
+
+def test_update_with_expected_version(session, add_item):
+    item = add_item("milk")
+    updated, status = update_item_fields(session, item.id, {"quantity": 3}, expected_versions=[item.version])
+    assert status == ITEM_OK
+    assert updated.quantity == 3
+
+def test_update_with_stale_version_is_refused(session, add_item):
+    item = add_item("milk")
+    update_item_fields(session, item.id, {"quantity": 3})
+    updated, status = update_item_fields(session, item.id, {"quantity": 99}, expected_versions=[item.version])
+    assert (updated, status) == (None, ITEM_VERSION_MISMATCH)
+    assert session.get(Item, item.id).quantity == 3
+
+def test_update_missing_item(session):
+    assert update_item_fields(session, 999, {"quantity": 1}) == (None, ITEM_NOT_FOUND)
+    assert update_item_fields(session, 999, {"quantity": 1}, expected_versions=[0]) == (None, ITEM_NOT_FOUND)
+
+def test_rename_keeps_name_lookup_in_step(session, add_item):
+    item = add_item("Straße")
+    update_item_fields(session, item.id, {"name": "Éclair"})
+    assert get_item_by_name(session, "ÉCLAIR").id == item.id
+    assert get_item_by_name(session, "strasse") is None
+
+def test_adjust_stock(session, add_item):
+    item = add_item("milk", quantity=5)
+    updated, status = adjust_item_stock(session, item.id, -2)
+    assert status == ITEM_OK
+    assert (updated.quantity, updated.version) == (3, item.version + 1)
+
+def test_adjust_below_zero_is_refused(session, add_item):
+    item = add_item("milk", quantity=5)
+    assert adjust_item_stock(session, item.id, -6) == (None, ITEM_INSUFFICIENT_STOCK)
+    assert session.exec(select(Item.quantity).where(Item.id == item.id)).one() == 5
+
+def test_adjust_missing_item(session):
+    assert adjust_item_stock(session, 999, 1) == (None, ITEM_NOT_FOUND)
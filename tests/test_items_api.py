@@ -0,0 +1,41 @@
+import uuid
+
+def _create(client, quantity=5):
+    response = client.post("/items/", json={"name": f"item-{uuid.uuid4().hex}", "quantity": quantity, "price": 1.0})
+    assert response.status_code == 200
+    return response.json()
+
+def _etag(client, item):
+    return client.get(f"/items/by-name/{item['name']}").headers["ETag"]
+
+def test_patch_with_current_etag(client):
+    item = _create(client)
+    response = client.patch(f"/items/{item['id']}", json={"quantity": 7}, headers={"If-Match": _etag(client, item)})
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 7
+    assert response.headers["ETag"] == f'"item-{item["id"]}-v{item["version"] + 1}"'
+
+def test_patch_with_stale_etag_is_412(client):
+    item = _create(client)
+    etag = _etag(client, item)
+    assert client.patch(f"/items/{item['id']}", json={"quantity": 7}, headers={"If-Match": etag}).status_code == 200
+    response = client.patch(f"/items/{item['id']}", json={"quantity": 1}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert client.get(f"/items/by-name/{item['name']}").json()["quantity"] == 7
+
+def test_put_with_stale_etag_is_412(client):
+    item = _create(client)
+    etag = _etag(client, item)
+    client.post(f"/items/{item['id']}/adjust", json={"delta": 1})
+    body = {"name": item["name"], "quantity": 1, "price": 1.0}
+    assert client.put(f"/items/{item['id']}", json=body, headers={"If-Match": etag}).status_code == 412
+
+def test_missing_item_is_404_not_412(client):
+    headers = {"If-Match": '"item-999999-v0"'}
+    assert client.patch("/items/999999", json={"quantity": 1}, headers=headers).status_code == 404
+    assert client.put("/items/999999", json={"name": "x", "quantity": 1, "price": 1.0}, headers=headers).status_code == 404
+
+def test_case_variant_of_existing_name_is_409(client):
+    item = _create(client)
+    response = client.post("/items/", json={"name": item["name"].upper(), "quantity": 1, "price": 1.0})
+    assert response.status_code == 409
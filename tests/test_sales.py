@@ -0,0 +1,60 @@
+from sqlmodel import select
+
+from models import Item, Sale, SaleLine
+from sales import (
+    SALE_INSUFFICIENT_STOCK, SALE_INVALID_QUANTITY, SALE_NOT_FOUND, SALE_OK, SALE_ROLLED_BACK,
+    apply_sale_batch,
+)
+
+def _quantity(session, item_id):
+    return session.exec(select(Item.quantity).where(Item.id == item_id)).one()
+
+def test_per_line_statuses(session, add_item):
+    milk = add_item("milk", quantity=5, price=2.0)
+    result = apply_sale_batch(session, [
+        SaleLine(item_id=milk.id, quantity=3),
+        SaleLine(item_id=milk.id, quantity=3),
+        SaleLine(name="MILK", quantity=2),
+        SaleLine(item_id=999, quantity=1),
+        SaleLine(name="bread", quantity=1),
+        SaleLine(item_id=milk.id, quantity=0),
+    ])
+    assert [line.status for line in result.lines] == [
+        SALE_OK, SALE_INSUFFICIENT_STOCK, SALE_OK, SALE_NOT_FOUND, SALE_NOT_FOUND, SALE_INVALID_QUANTITY,
+    ]
+    assert (result.committed, result.succeeded, result.failed) == (True, 2, 4)
+    assert [line.total for line in result.lines[:3]] == [6.0, None, 4.0]
+    assert _quantity(session, milk.id) == 0
+
+def test_names_match_across_case_and_accents(session, add_item):
+    eclair = add_item("Éclair", quantity=5)
+    result = apply_sale_batch(session, [SaleLine(name="éclair", quantity=1), SaleLine(name="ÉCLAIR", quantity=1)])
+    assert [line.item_id for line in result.lines] == [eclair.id, eclair.id]
+    assert _quantity(session, eclair.id) == 3
+
+def test_atomic_batch_rolls_back_on_any_failure(session, add_item):
+    milk = add_item("milk", quantity=5)
+    result = apply_sale_batch(session, [
+        SaleLine(item_id=milk.id, quantity=2),
+        SaleLine(item_id=milk.id, quantity=10),
+    ], atomic=True)
+    assert (result.committed, result.succeeded, result.failed) == (False, 0, 2)
+    assert [line.status for line in result.lines] == [SALE_ROLLED_BACK, SALE_INSUFFICIENT_STOCK]
+    assert _quantity(session, milk.id) == 5
+    assert session.exec(select(Sale)).all() == []
+
+def test_sale_ids_point_at_matching_rows(session, add_item):
+    milk = add_item("milk", quantity=20, price=1.0)
+    bread = add_item("bread", quantity=20, price=3.0)
+    lines = [
+        SaleLine(item_id=milk.id, quantity=2),
+        SaleLine(item_id=bread.id, quantity=1),
+        SaleLine(item_id=milk.id, quantity=2),
+        SaleLine(item_id=milk.id, quantity=5),
+    ]
+    result = apply_sale_batch(session, lines)
+    sale_ids = [line.sale_id for line in result.lines]
+    assert len(set(sale_ids)) == len(lines)
+    for line, sale_id in zip(lines, sale_ids):
+        sale = session.get(Sale, sale_id)
+        assert (sale.item_id, sale.quantity) == (line.item_id, line.quantity)